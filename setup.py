@@ -11,12 +11,12 @@ VERSION = '0.1.0'
 
 # What packages are required for this module to be executed?
 REQUIRED = [
-    'numpy', 'matplotlib',
+    'numpy',
 ]
 
 # What packages are optional?
 EXTRAS = {
-    'visualize': ['pygame', 'graphviz'],
+    'visualize': ['pygame', 'graphviz', 'matplotlib'],
 }
 
 # The rest you shouldn't have to touch too much :)
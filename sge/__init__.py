@@ -1,2 +1,4 @@
 
 from .mazeenv import MazeEnv
+from .vecenv import VecMazeEnv
+from .subprocenv import SubprocVecEnv
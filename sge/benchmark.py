@@ -0,0 +1,296 @@
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+
+__PATH__ = os.path.abspath(os.path.dirname(__file__))
+
+CONFIGS = ('single', 'batched', 'subproc')
+# optional packages that must only be imported when rendering
+RENDER_MODULES = ('matplotlib', 'pygame', 'graphviz')
+IMPORT_BUDGET_MS = 100  # import sge on top of numpy
+
+
+def list_datasets():
+    # (game_name, graph_param) of every graph file in sge/data
+    datasets = []
+    for fname in sorted(glob.glob(os.path.join(__PATH__, 'data', '*', '*.npy'))):
+        name = os.path.splitext(os.path.basename(fname))[0]
+        prefix, graph_param = name.split('_', 1)
+        game_name = {'play': 'playground', 'mining': 'mining'}[prefix]
+        datasets.append((game_name, graph_param))
+    return datasets
+
+
+def bench_single(game_name, graph_param, nb_step, nb_reset, game_len, seed):
+    from .mazeenv import MazeEnv
+    env = MazeEnv(game_name, graph_param, game_len, 0.99)
+    actions = sorted(env.get_actions(), key=lambda a: a.value[0])
+    rng = np.random.RandomState(seed)
+
+    env.reset(seed)
+    latency = np.zeros(nb_step)
+    for i in range(nb_step):
+        action = actions[rng.randint(len(actions))]
+        t = time.perf_counter()
+        _, _, done, _ = env.step(action)
+        latency[i] = time.perf_counter() - t
+        if done:
+            env.reset()
+    reset_time = _time_resets(lambda: env.reset(), nb_reset)
+    return _summary(latency, 1, reset_time, nb_reset,
+                    _env_memory(lambda: MazeEnv(game_name, graph_param, game_len, 0.99), 1))
+
+
+def bench_batched(game_name, graph_param, nb_step, nb_reset, game_len, seed, nb_env):
+    from .gametables import ACTION_CODE
+    from .vecenv import VecMazeEnv
+    env = VecMazeEnv(game_name, graph_param, game_len, 0.99, nb_env)
+    codes = np.array(sorted(ACTION_CODE[a] for a in env.get_actions()))
+    rng = np.random.RandomState(seed)
+
+    env.reset(seed)
+    nb_batch = max(nb_step // nb_env, 1)
+    latency = np.zeros(nb_batch)
+    for i in range(nb_batch):
+        actions = codes[rng.randint(len(codes), size=nb_env)]
+        t = time.perf_counter()
+        _, _, done, _ = env.step(actions)
+        latency[i] = time.perf_counter() - t
+        if done.any():
+            env.reset(env_ids=done.nonzero()[0])
+    reset_time = _time_resets(lambda: env.reset(), max(nb_reset // nb_env, 1))
+    return _summary(latency, nb_env, reset_time, max(nb_reset // nb_env, 1) * nb_env,
+                    _env_memory(lambda: VecMazeEnv(game_name, graph_param, game_len, 0.99, nb_env), nb_env))
+
+
+def bench_subproc(game_name, graph_param, nb_step, nb_reset, game_len, seed, nb_env):
+    from .subprocenv import SubprocVecEnv
+    from .gametables import ACTION_CODE
+    env = SubprocVecEnv(game_name, graph_param, game_len, 0.99, nb_env, seed=seed)
+    try:
+        codes = np.array(sorted(ACTION_CODE[a] for a in env.get_actions()))
+        rng = np.random.RandomState(seed)
+
+        env.reset()
+        nb_batch = max(nb_step // nb_env, 1)
+        latency = np.zeros(nb_batch)
+        for i in range(nb_batch):
+            actions = codes[rng.randint(len(codes), size=nb_env)]
+            t = time.perf_counter()
+            env.step(actions)
+            latency[i] = time.perf_counter() - t
+        reset_time = _time_resets(lambda: env.reset(), max(nb_reset // nb_env, 1))
+    finally:
+        env.close()
+    # memory lives in the worker processes and is not measured here
+    return _summary(latency, nb_env, reset_time, max(nb_reset // nb_env, 1) * nb_env, None)
+
+
+def bench_elig(game_name, graph_param, nb_call, seed):
+    # average cost of one get_elig call (matrix) and one incremental update
+    from .mazeenv import load_game_config
+    from .graph import SubtaskGraph
+    game_config, graph_folder, filename = load_game_config(game_name, graph_param)
+    graph = SubtaskGraph(graph_folder, filename, game_config.nb_subtask_type,
+                         elig_engine='incremental')
+    rng = np.random.RandomState(seed)
+    matrix_cost, incremental_cost = np.zeros(graph.num_graph), np.zeros(graph.num_graph)
+    for graph_index in range(graph.num_graph):
+        graph.set_graph_index(graph_index)
+        completion = np.zeros(graph.nb_subtask, dtype=np.int8)
+        flips = rng.randint(graph.nb_subtask, size=nb_call)
+
+        t = time.perf_counter()
+        for ind in flips:
+            graph.get_elig(completion)
+        matrix_cost[graph_index] = (time.perf_counter() - t) / nb_call
+
+        graph.reset_elig(completion)
+        t = time.perf_counter()
+        for ind in flips:
+            completion[ind] = 1 - completion[ind]
+            graph.update_elig(completion, ind)
+        incremental_cost[graph_index] = (time.perf_counter() - t) / nb_call
+    return {
+        'num_graph': graph.num_graph,
+        'matrix_us_mean': matrix_cost.mean() * 1e6,
+        'matrix_us_max': matrix_cost.max() * 1e6,
+        'incremental_us_mean': incremental_cost.mean() * 1e6,
+        'incremental_us_max': incremental_cost.max() * 1e6,
+    }
+
+
+def bench_import(module='sge', repeat=5):
+    # time to import module in a fresh interpreter, on top of numpy (best of
+    # repeat), and the rendering packages loaded by the import
+    code = ('import sys, time, json, numpy; t = time.perf_counter(); import {}; '
+            't = time.perf_counter() - t; print(json.dumps([t, sorted(set('
+            'm.split(".")[0] for m in sys.modules) & set({!r}))]))').format(
+                module, list(RENDER_MODULES))
+    best, loaded = None, []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             stdout=subprocess.PIPE, cwd=os.path.dirname(__PATH__))
+        t, loaded = json.loads(out.stdout.decode('utf-8'))
+        best = t if best is None else min(best, t)
+    numpy_ms = _import_numpy_ms(repeat)
+    return {'module': module, 'import_ms': best * 1e3, 'numpy_import_ms': numpy_ms,
+            'render_modules': loaded}
+
+
+def check_import(budget_ms=IMPORT_BUDGET_MS, module='sge'):
+    # raises AssertionError if importing module loads a rendering package or
+    # takes more than budget_ms (numpy excluded)
+    result = bench_import(module)
+    assert not result['render_modules'], 'import {} loads {}'.format(
+        module, ', '.join(result['render_modules']))
+    assert result['import_ms'] <= budget_ms, 'import {} takes {:.1f}ms > {}ms'.format(
+        module, result['import_ms'], budget_ms)
+    return result
+
+
+def run(datasets=None, configs=CONFIGS, nb_step=2000, nb_reset=100,
+        nb_env=64, nb_proc=4, nb_elig_call=20, game_len=70, seed=0, log=None):
+    if datasets is None:
+        datasets = list_datasets()
+    result = dict(meta=_meta(), args=dict(
+        configs=list(configs), nb_step=nb_step, nb_reset=nb_reset, nb_env=nb_env,
+        nb_proc=nb_proc, nb_elig_call=nb_elig_call, game_len=game_len, seed=seed),
+        datasets=[])
+    result['import'] = bench_import()
+    for game_name, graph_param in datasets:
+        entry = dict(game_name=game_name, graph_param=graph_param)
+        entry['elig'] = bench_elig(game_name, graph_param, nb_elig_call, seed)
+        if 'single' in configs:
+            entry['single'] = bench_single(
+                game_name, graph_param, nb_step, nb_reset, game_len, seed)
+        if 'batched' in configs:
+            entry['batched'] = bench_batched(
+                game_name, graph_param, nb_step, nb_reset, game_len, seed, nb_env)
+        if 'subproc' in configs:
+            entry['subproc'] = bench_subproc(
+                game_name, graph_param, nb_step, nb_reset, game_len, seed, nb_proc)
+        result['datasets'].append(entry)
+        if log is not None:
+            log(_format_entry(entry))
+    return result
+
+
+# internal
+def _import_numpy_ms(repeat):
+    code = ('import time; t = time.perf_counter(); import numpy; '
+            'print(time.perf_counter() - t)')
+    return min(float(subprocess.run([sys.executable, '-c', code], check=True,
+                                    stdout=subprocess.PIPE).stdout)
+               for _ in range(repeat)) * 1e3
+
+
+def _time_resets(reset, nb_reset):
+    t = time.perf_counter()
+    for _ in range(nb_reset):
+        reset()
+    return time.perf_counter() - t
+
+
+def _env_memory(make_env, nb_env):
+    tracemalloc.start()
+    env = make_env()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del env
+    return size / nb_env
+
+
+def _summary(latency, nb_env, reset_time, nb_reset, memory):
+    return {
+        'steps_per_sec': nb_env * len(latency) / latency.sum(),
+        'resets_per_sec': nb_reset / reset_time,
+        'step_latency_us_p50': np.percentile(latency, 50) * 1e6,
+        'step_latency_us_p99': np.percentile(latency, 99) * 1e6,
+        'memory_bytes_per_env': memory,
+        'nb_env': nb_env,
+    }
+
+
+def _meta():
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _format_entry(entry):
+    lines = ['{game_name} {graph_param}: get_elig {matrix:.1f}us (incremental {incr:.1f}us)'.format(
+        game_name=entry['game_name'], graph_param=entry['graph_param'],
+        matrix=entry['elig']['matrix_us_mean'], incr=entry['elig']['incremental_us_mean'])]
+    for config in CONFIGS:
+        if config in entry:
+            r = entry[config]
+            lines.append('  {:8s} steps/s={:10.0f} resets/s={:8.0f} p50={:8.1f}us p99={:8.1f}us'.format(
+                config, r['steps_per_sec'], r['resets_per_sec'],
+                r['step_latency_us_p50'], r['step_latency_us_p99']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Throughput and latency benchmark of the environments')
+    parser.add_argument('--datasets', nargs='*', default=None,
+                        help='graph files to run, e.g. play_D1_train_1 mining_eval_1 (default: all)')
+    parser.add_argument('--configs', nargs='*', default=list(CONFIGS),
+                        choices=CONFIGS, help='environment configurations')
+    parser.add_argument('--nb_step', default=2000, type=int,
+                        help='number of env steps per configuration')
+    parser.add_argument('--nb_reset', default=100, type=int,
+                        help='number of env resets per configuration')
+    parser.add_argument('--nb_env', default=64, type=int,
+                        help='number of envs of the batched configuration')
+    parser.add_argument('--nb_proc', default=4, type=int,
+                        help='number of processes of the subproc configuration')
+    parser.add_argument('--nb_elig_call', default=20, type=int,
+                        help='number of get_elig calls per graph')
+    parser.add_argument('--game_len', default=70, type=int,
+                        help='episode length')
+    parser.add_argument('--seed', default=0, type=int, help='random seed')
+    parser.add_argument('--output', default=None,
+                        help='path of the JSON result (default: stdout)')
+    parser.add_argument('--check_import', default=None, type=float, nargs='?',
+                        const=IMPORT_BUDGET_MS, metavar='BUDGET_MS',
+                        help='only check that import sge loads no rendering package '
+                             'and takes at most BUDGET_MS (default: {}ms, numpy excluded)'.format(
+                                 IMPORT_BUDGET_MS))
+    args = parser.parse_args()
+
+    if args.check_import is not None:
+        try:
+            r = check_import(args.check_import)
+        except AssertionError as e:
+            sys.exit('FAILED: {}'.format(e))
+        print('import sge: {:.1f}ms (numpy {:.1f}ms), no rendering package'.format(
+            r['import_ms'], r['numpy_import_ms']))
+        sys.exit(0)
+
+    datasets = list_datasets()
+    if args.datasets:
+        prefix = {'playground': 'play', 'mining': 'mining'}
+        datasets = [(game_name, graph_param) for game_name, graph_param in datasets
+                    if prefix[game_name] + '_' + graph_param in args.datasets]
+    result = run(datasets, args.configs, args.nb_step, args.nb_reset, args.nb_env,
+                 args.nb_proc, args.nb_elig_call, args.game_len, args.seed,
+                 log=lambda line: print(line, file=sys.stderr))
+    if args.output is None:
+        print(json.dumps(result, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
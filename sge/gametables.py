@@ -0,0 +1,66 @@
+import numpy as np
+from .utils import KEY, MOVE_ACTS
+
+# action code of each KEY (KEY.TRANSFORM and KEY.USE_1 share the code 5)
+ACTION_CODE = {key: key.value[0] for key in KEY if key != KEY.QUIT}
+NB_ACTION_CODE = max(ACTION_CODE.values()) + 1
+
+
+class GameTables(object):
+    """Game config (Playground or Mining) compiled into NumPy lookup tables,
+    indexed by integer action code (ACTION_CODE) and object id (oid), so that
+    the step path never looks up KEY enums or the config dicts.
+
+    action tables (NB_ACTION_CODE,): legal_code, move_code, oper_type (-1 for
+    moves), dx, dy
+    object tables (nb_obj_type,): speed, pickable, transformable, outcome
+    subtask_table (NB_ACTION_CODE, nb_obj_type): subtask id, -1 if none
+    """
+    def __init__(self, config):
+        # action tables
+        self.legal_code = np.zeros(NB_ACTION_CODE, dtype=np.bool_)
+        self.move_code = np.zeros(NB_ACTION_CODE, dtype=np.bool_)
+        self.oper_type = np.full(NB_ACTION_CODE, -1, dtype=np.int64)
+        self.dx = np.zeros(NB_ACTION_CODE, dtype=np.int64)
+        self.dy = np.zeros(NB_ACTION_CODE, dtype=np.int64)
+        for action in config.legal_actions:
+            self.legal_code[ACTION_CODE[action]] = True
+        for action in MOVE_ACTS:
+            self.move_code[ACTION_CODE[action]] = True
+        for action, oper in config.operation_list.items():
+            self.oper_type[ACTION_CODE[action]] = oper['oper_type']
+        self.dx[ACTION_CODE[KEY.RIGHT]], self.dx[ACTION_CODE[KEY.LEFT]] = 1, -1
+        self.dy[ACTION_CODE[KEY.DOWN]], self.dy[ACTION_CODE[KEY.UP]] = 1, -1
+
+        # object tables
+        nb_obj_type = config.nb_obj_type
+        self.speed = np.zeros(nb_obj_type)
+        self.pickable = np.zeros(nb_obj_type, dtype=np.bool_)
+        self.transformable = np.zeros(nb_obj_type, dtype=np.bool_)
+        self.outcome = np.arange(nb_obj_type)
+        # at most one object per subtask plus the additional objects
+        self.max_obj = config.nb_subtask_type
+        for obj in config.object_param_list:
+            oid = obj['oid']
+            self.speed[oid] = obj.get('speed', 0)
+            self.pickable[oid] = obj['pickable']
+            self.transformable[oid] = obj['transformable']
+            self.outcome[oid] = obj.get('outcome', oid)
+            self.max_obj += obj.get('max', 0)
+
+        # (action, oid) -> subtask id
+        self.subtask_table = np.full(
+            (NB_ACTION_CODE, nb_obj_type), -1, dtype=np.int64)
+        for (action, oid), sub_id in config.subtask_param_to_id.items():
+            self.subtask_table[ACTION_CODE[action], oid] = sub_id
+
+    def is_legal(self, code):
+        return 0 <= code < NB_ACTION_CODE and self.legal_code[code]
+
+
+def action_code(action):
+    # KEY or integer action code -> integer action code (-1: KEY.QUIT)
+    if isinstance(action, KEY):
+        code = action.value[0]
+        return code if isinstance(code, int) else -1
+    return int(action)
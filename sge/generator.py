@@ -0,0 +1,208 @@
+import os
+import numpy as np
+from . import graphpack
+from .mazeenv import load_game_config
+
+__PATH__ = os.path.abspath(os.path.dirname(__file__))
+
+# structure of the playground graph sets (measured on sge/data)
+#   widths: number of subtasks of each layer
+#   nb_and: (min, max) number of AND nodes between layer l and l+1
+#   fan_in: (min, max) number of inputs of an AND node
+#   not_prob: probability that an AND input is a NOT edge
+#   or_fan_in: (min, max) number of AND inputs of a subtask (layer >= 1)
+#   rewards: (min, max) reward of the subtasks of each layer
+PRESETS = {
+    'D1': dict(widths=[6, 4, 2, 1], nb_and=[(3, 5), (2, 4), (1, 2)],
+               fan_in=(1, 5), not_prob=0.31, or_fan_in=(1, 2),
+               rewards=[(0.1, 0.2), (0.3, 0.4), (0.7, 0.9), (1.8, 2.0)]),
+    'D2': dict(widths=[7, 5, 2, 1], nb_and=[(3, 5), (2, 4), (1, 2)],
+               fan_in=(1, 6), not_prob=0.37, or_fan_in=(1, 2),
+               rewards=[(0.1, 0.2), (0.3, 0.4), (0.7, 0.9), (1.8, 2.0)]),
+    'D3': dict(widths=[5, 4, 4, 2, 1], nb_and=[(3, 5), (3, 4), (2, 4), (1, 2)],
+               fan_in=(1, 5), not_prob=0.26, or_fan_in=(1, 2),
+               rewards=[(0.1, 0.2), (0.3, 0.4), (0.6, 0.7), (1.0, 1.2), (2.0, 2.2)]),
+    'D4': dict(widths=[4, 3, 3, 3, 2, 1],
+               nb_and=[(2, 5), (2, 4), (2, 4), (2, 4), (1, 2)],
+               fan_in=(1, 4), not_prob=0.08, or_fan_in=(1, 2),
+               rewards=[(0.1, 0.2), (0.3, 0.4), (0.6, 0.7), (1.0, 1.2),
+                        (1.4, 1.6), (2.4, 2.6)]),
+}
+
+
+class GraphGenerator(object):
+    """Random layered subtask graphs in the schema of the graph files (W_a,
+    W_o, ANDmat, ORmat, rmag, trind), for the subtasks of a game config.
+
+    The subtasks of layer 0 are always eligible. Every AND node between layer
+    l and l+1 has at least one input in layer l and at least one solid
+    (non-NOT) input, and is an input of at least one subtask of layer l+1.
+    Graphs are generated by batches with array operations (only the layers
+    are looped over), in the flat format of graphpack.GraphPackWriter.
+    """
+    def __init__(self, config, widths, nb_and, fan_in=(1, 5), not_prob=0.3,
+                 or_fan_in=(1, 2), rewards=None, seed=None):
+        if sum(widths) > config.nb_subtask_type:
+            raise ValueError('{} subtasks, but the game has {} subtask types'.format(
+                sum(widths), config.nb_subtask_type))
+        if len(nb_and) != len(widths) - 1:
+            raise ValueError('nb_and needs one (min, max) per layer transition')
+        self.config = config
+        self.widths = list(widths)
+        self.nb_and = [tuple(r) for r in nb_and]
+        self.fan_in = fan_in
+        self.not_prob = not_prob
+        self.or_fan_in = or_fan_in
+        if rewards is None:  # doubles at every layer
+            rewards = [(0.1 * 2**lv, 0.2 * 2**lv) for lv in range(len(widths))]
+        self.rewards = rewards
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_preset(cls, config, name, seed=None, **kwargs):
+        params = dict(PRESETS[name], **kwargs)
+        return cls(config, seed=seed, **params)
+
+    def generate(self, nb_graph):
+        # list of graph dicts (as in the .npy files)
+        return unflatten_graphs(self.generate_batch(nb_graph))
+
+    def write(self, fname, nb_graph, batch_size=10000):
+        # streams nb_graph graphs into a packed file
+        with graphpack.GraphPackWriter(fname) as writer:
+            for start in range(0, nb_graph, batch_size):
+                writer.add_batch(self.generate_batch(min(batch_size, nb_graph - start)))
+        return fname
+
+    def generate_batch(self, nb_graph):
+        rng = self.rng
+        B, P = nb_graph, self.widths
+        L = len(P) - 1
+        off = np.cumsum([0] + P)
+        T = off[-1]
+        nb_and = np.stack([rng.integers(lo, hi + 1, size=B)
+                           for lo, hi in self.nb_and], axis=1)  # (B, L)
+        max_and = [hi for _, hi in self.nb_and]
+        and_bias = np.cumsum([0] + max_and)
+        A = and_bias[-1]
+
+        # 1. AND nodes (padded to max_and per layer)
+        ANDmat = np.zeros((B, A, T), dtype=np.int8)
+        ORmat = np.zeros((B, T, A), dtype=np.int8)
+        valid = np.zeros((B, A), dtype=np.bool_)
+        for lv in range(L):
+            Na, C = max_and[lv], off[lv+1]
+            k = np.minimum(rng.integers(self.fan_in[0], self.fan_in[1] + 1,
+                                        size=(B, Na)), C)
+            # one input in layer lv, then the k-1 other inputs at random
+            last = off[lv] + rng.integers(P[lv], size=(B, Na))
+            keys = rng.random((B, Na, C))
+            np.put_along_axis(keys, last[..., None], -1, axis=2)
+            chosen = _rank(keys) < k[..., None]
+            neg = chosen & (rng.random((B, Na, C)) < self.not_prob)
+            # at least one solid input
+            nopos = ~(chosen & ~neg).any(2)
+            b, a = nopos.nonzero()
+            neg[b, a, last[b, a]] = False
+            rows = np.arange(Na) < nb_and[:, lv, None]
+            vals = np.where(neg, -1, 1).astype(np.int8) * chosen * rows[..., None]
+            ANDmat[:, and_bias[lv]:and_bias[lv+1], :C] = vals
+            valid[:, and_bias[lv]:and_bias[lv+1]] = rows
+
+            # 2. OR: AND inputs of the subtasks of layer lv+1
+            Np = P[lv+1]
+            k = np.minimum(rng.integers(self.or_fan_in[0], self.or_fan_in[1] + 1,
+                                        size=(B, Np)), nb_and[:, lv, None])
+            keys = rng.random((B, Np, Na))
+            keys[~np.broadcast_to(rows[:, None], keys.shape)] = 2
+            chosen = _rank(keys) < k[..., None]
+            # every AND node is used by a subtask
+            b, a = (rows & ~chosen.any(1)).nonzero()
+            chosen[b, rng.integers(Np, size=len(b)), a] = True
+            ORmat[:, off[lv+1]:off[lv+2], and_bias[lv]:and_bias[lv+1]] = chosen
+
+        # 3. flat batch
+        batch = dict()
+        nb_and_all = nb_and.sum(1)
+        batch['and_shape'] = np.stack([nb_and_all, np.full(B, T)], axis=1)
+        batch['and_data'] = ANDmat[valid].ravel()
+        batch['or_shape'] = np.stack([np.full(B, T), nb_and_all], axis=1)
+        batch['or_data'] = ORmat[np.broadcast_to(valid[:, None], ORmat.shape)]
+        # W_a / W_o: (B, L, ...) blocks, masked to the actual shape of each level
+        Na = max(max_and)
+        W_a = np.zeros((B, L, Na, T), dtype=np.int8)
+        W_o = np.zeros((B, L, max(P[1:]), Na), dtype=np.int8)
+        for lv in range(L):
+            na = max_and[lv]
+            W_a[:, lv, :na] = ANDmat[:, and_bias[lv]:and_bias[lv+1]]
+            W_o[:, lv, :P[lv+1], :na] = \
+                ORmat[:, off[lv+1]:off[lv+2], and_bias[lv]:and_bias[lv+1]]
+        W_a[W_a < 0] = -10
+        a_rows = np.arange(Na)[None, None, :] < nb_and[..., None]
+        mask = a_rows[..., None] & (np.arange(T) < off[1:L+1, None])[None, :, None]
+        batch['wa_shape'] = np.stack(
+            [nb_and.ravel(), np.tile(off[1:L+1], B)], axis=1)
+        batch['wa_data'] = W_a[mask]
+        mask = (np.arange(W_o.shape[2]) < np.array(P[1:])[:, None])[None, :, :, None] \
+            & a_rows[:, :, None, :]
+        batch['wo_shape'] = np.stack([np.tile(P[1:], B), nb_and.ravel()], axis=1)
+        batch['wo_data'] = W_o[mask]
+        batch['nb_level'] = np.full(B, L)
+        batch['nb_sub'] = np.full(B, T)
+        lo, hi = np.repeat(np.array(self.rewards, dtype=np.float64).T, P, axis=1)
+        batch['rmag'] = rng.uniform(lo, hi, size=(B, T)).ravel()
+        ids = _rank(rng.random((B, self.config.nb_subtask_type)))
+        batch['trind'] = ids[:, :T].astype(np.int32).ravel()
+        return batch
+
+
+def unflatten_graphs(batch):
+    # flat batch of GraphPackWriter -> list of graph dicts
+    mats = dict()
+    for name in ['and', 'or', 'wa', 'wo']:
+        shape = batch[name+'_shape']
+        offset = np.concatenate([[0], np.cumsum(shape.prod(1))])
+        data = batch[name+'_data']
+        mats[name] = [data[offset[i]:offset[i+1]].reshape(shape[i])
+                      for i in range(len(shape))]
+    level = np.concatenate([[0], np.cumsum(batch['nb_level'])])
+    sub = np.concatenate([[0], np.cumsum(batch['nb_sub'])])
+    graphs = []
+    for i in range(len(batch['nb_level'])):
+        graphs.append(dict(
+            ANDmat=mats['and'][i], ORmat=mats['or'][i],
+            W_a=mats['wa'][level[i]:level[i+1]], W_o=mats['wo'][level[i]:level[i+1]],
+            rmag=batch['rmag'][sub[i]:sub[i+1]].tolist(),
+            trind=np.array(batch['trind'][sub[i]:sub[i+1]])))
+    return graphs
+
+
+def _rank(keys):
+    # rank of each entry along the last axis (0: smallest)
+    return keys.argsort(-1).argsort(-1)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(
+        description='Generate random subtask graphs into a ' + graphpack.EXT + ' file')
+    parser.add_argument('--game_name', default='playground')
+    parser.add_argument('--preset', default='D1', choices=sorted(PRESETS))
+    parser.add_argument('--graph_param', default=None,
+                        help='output name, loadable as MazeEnv(game_name, graph_param) '
+                             '(default: gen_<preset>)')
+    parser.add_argument('--output', default=None, help='output path (instead of graph_param)')
+    parser.add_argument('--nb_graph', default=10000, type=int)
+    parser.add_argument('--batch_size', default=10000, type=int)
+    parser.add_argument('--seed', default=None, type=int)
+    args = parser.parse_args()
+
+    graph_param = args.graph_param or 'gen_' + args.preset
+    game_config, graph_folder, filename = load_game_config(args.game_name, graph_param)
+    fname = args.output or os.path.normpath(
+        os.path.join(__PATH__, graph_folder, filename + graphpack.EXT))
+    t = time.time()
+    GraphGenerator.from_preset(game_config, args.preset, args.seed).write(
+        fname, args.nb_graph, args.batch_size)
+    print('{} graphs in {:.2f}s -> {}'.format(args.nb_graph, time.time() - t, fname))
@@ -1,16 +1,25 @@
 import os
+from collections import OrderedDict
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
 
 __PATH__ = os.path.abspath(os.path.dirname(__file__))
+ENGINE_CACHE_SIZE = 128  # compiled graphs kept by the 'incremental' engine
+LAYOUT_CACHE_SIZE = 32  # graph layouts kept by draw_graph
 
 
 class SubtaskGraph(object):
-    def __init__(self, folder, filename, max_task=0):
+    def __init__(self, folder, filename, max_task=0, elig_engine='matrix'):
         # 1. init/load graph
         self.filename = filename
+        if elig_engine not in ('matrix', 'incremental'):
+            raise ValueError("Unsupported : {}".format(elig_engine))
+        self.elig_engine = elig_engine
+        self._engine_cache = OrderedDict()  # graph_index -> EligibilityEngine (LRU)
+        self._layout_cache = OrderedDict()  # (graph_index, rewards) -> GraphLayout (LRU)
+        self._stack = None
+        self._sparse = None  # SparseGraph of the current graph
+        self._dense = None  # (ANDmat, ORmat, b_AND) of the current graph
 
         # subtask_list / edges (ANDmat&ORmat, allow) / subtask reward
         self._load_graph(folder)
@@ -18,36 +27,54 @@ class SubtaskGraph(object):
         self.graph_index = -1
 
     def _load_graph(self, folder):
-        fname = os.path.join(__PATH__, folder, self.filename+'.npy')
-        self.graph_list = np.load(fname, allow_pickle=True)
+        # prefer the memory-mapped packed file (see sge/graphpack.py)
+        from . import graphpack
+        fname = os.path.join(__PATH__, folder, self.filename)
+        if os.path.exists(fname+graphpack.EXT):
+            self.graph_list = graphpack.PackedGraphList(fname+graphpack.EXT)
+        else:
+            self.graph_list = np.load(fname+'.npy', allow_pickle=True)
+        self._packed = isinstance(self.graph_list, graphpack.PackedGraphList)
         self.num_graph = len(self.graph_list)
 
+    def get_max_nb_and(self):
+        if self._packed:
+            return int(self.graph_list.and_shape[:, 0].max())
+        return max(graph['ANDmat'].shape[0] for graph in self.graph_list)
+
     def set_graph_index(self, graph_index):
+        # The matrices are not densified: the 'incremental' engine uses the
+        # SparseGraph (read from the CSR arrays of a packed file), and ANDmat,
+        # ORmat and b_AND are built on first use (e.g. by the 'matrix' engine).
         self.graph_index = graph_index
-        graph = self.graph_list[graph_index]
-        self.num_level = len(graph['W_a'])
-        self.ANDmat = graph['ANDmat'].astype(np.float)
-        self.ORmat = graph['ORmat'].astype(np.float)
-        self.W_a = graph['W_a']
-        self.W_o = graph['W_o']
-        self.nb_subtask = self.ORmat.shape[0]
-
-        self.numP = [self.W_a[0].shape[1]]
+        self._sparse = None
+        self._dense = None
+        if self._packed:
+            wa_shape, wo_shape = self.graph_list.get_level_shapes(graph_index)
+            self.rew_mag, trind = self.graph_list.get_subtasks(graph_index)
+        else:
+            graph = self.graph_list[graph_index]
+            wa_shape = [w.shape for w in graph['W_a']]
+            wo_shape = [w.shape for w in graph['W_o']]
+            self.rew_mag, trind = graph['rmag'], graph['trind']
+        self.num_level = len(wa_shape)
+        self.nb_subtask = len(trind)
+
+        self.numP = [wa_shape[0][1]]
         self.numA = []
         self.num_or = self.numP[0]
         self.num_and = 0
         for lv in range(self.num_level):
-            self.numP.append(self.W_o[lv].shape[0])
-            self.numA.append(self.W_a[lv].shape[0])
+            self.numP.append(wo_shape[lv][0])
+            self.numA.append(wa_shape[lv][0])
             self.num_or = self.num_or + self.numP[lv + 1]
             self.num_and = self.num_and + self.numA[lv]
 
-        self.b_AND = np.not_equal(self.ANDmat, 0).sum(1).astype(np.float)
         self.b_OR = np.ones(self.nb_subtask)
         self.b_OR[:self.numP[0]] = 0
 
-        self.rew_mag = graph['rmag']
-        self.subtask_id_list = (graph['trind']).tolist()
+        self.subtask_id_list = np.asarray(trind).tolist()
+        self.ind_to_id_array = np.array(trind)
 
         self.ind_to_id = dict()
         self.id_to_ind = dict()
@@ -56,37 +83,133 @@ class SubtaskGraph(object):
             self.ind_to_id[ind] = id
             self.id_to_ind[id] = ind
 
+        if self.elig_engine == 'incremental':
+            if graph_index in self._engine_cache:
+                self._engine_cache.move_to_end(graph_index)
+            else:
+                self._engine_cache[graph_index] = EligibilityEngine(
+                    self.get_sparse())
+                if len(self._engine_cache) > ENGINE_CACHE_SIZE:
+                    self._engine_cache.popitem(last=False)
+            self.engine = self._engine_cache[graph_index]
+        else:
+            self.engine = None
+
+    def get_sparse(self):
+        # SparseGraph of the current graph
+        if self.elig_engine == 'incremental' and self.graph_index in self._engine_cache:
+            return self._engine_cache[self.graph_index].graph
+        if self._sparse is None:
+            if self._packed:
+                and_ptr, and_ind, and_val = self.graph_list.get_csr('and', self.graph_index)
+                or_ptr, or_ind, or_val = self.graph_list.get_csr('or', self.graph_index)
+                if not (np.isin(and_val, (-1, 1)).all() and (or_val == 1).all()):
+                    raise ValueError('SparseGraph requires ANDmat in {-1,0,1} and ORmat in {0,1}')
+                self._sparse = SparseGraph(self.nb_subtask, and_ptr, and_ind,
+                                           and_val < 0, or_ptr, or_ind, self.b_OR)
+            else:
+                graph = self.graph_list[self.graph_index]
+                self._sparse = SparseGraph.from_dense(
+                    graph['ANDmat'], graph['ORmat'], self.b_OR)
+        return self._sparse
+
+    # dense float64 matrices of the current graph, built on first use
+    @property
+    def ANDmat(self):
+        return self._get_dense()[0]
+
+    @property
+    def ORmat(self):
+        return self._get_dense()[1]
+
+    @property
+    def b_AND(self):
+        return self._get_dense()[2]
+
+    @property
+    def W_a(self):
+        return self.graph_list[self.graph_index]['W_a']
+
+    @property
+    def W_o(self):
+        return self.graph_list[self.graph_index]['W_o']
+
+    def _get_dense(self):
+        if self._dense is None:
+            if self._packed:
+                ANDmat = self.graph_list.get_matrix('and', self.graph_index)
+                ORmat = self.graph_list.get_matrix('or', self.graph_index)
+            else:
+                graph = self.graph_list[self.graph_index]
+                ANDmat, ORmat = graph['ANDmat'], graph['ORmat']
+            ANDmat = ANDmat.astype(np.float64)
+            ORmat = ORmat.astype(np.float64)
+            b_AND = np.not_equal(ANDmat, 0).sum(1).astype(np.float64)
+            self._dense = ANDmat, ORmat, b_AND
+        return self._dense
+
     def get_elig(self, completion):
-        ANDmat = self.ANDmat
-        b_AND = self.b_AND
-        ORmat = self.ORmat
+        ANDmat, ORmat, b_AND = self._get_dense()
         b_OR = self.b_OR
 
-        tp = completion.astype(np.float)*2-1  # \in {-1,1}
+        tp = completion.astype(np.float64)*2-1  # \in {-1,1}
         # sign(A x tp + b) (+1 or 0)
         ANDout = np.not_equal(
-            np.sign((ANDmat.dot(tp)-b_AND)), -1).astype(np.float)
+            np.sign((ANDmat.dot(tp)-b_AND)), -1).astype(np.float64)
         elig = np.not_equal(np.sign((ORmat.dot(ANDout)-b_OR)), -1)
         return elig
 
+    def reset_elig(self, completion):
+        if self.engine is None:
+            return self.get_elig(completion)
+        return self.engine.reset(completion)
+
+    def update_elig(self, completion, sub_ind):
+        # returns eligibility and the list of changed indices (None: unknown)
+        if self.engine is None:
+            return self.get_elig(completion), None
+        return self.engine.update(sub_ind, completion[sub_ind] == 1)
+
+    # all the graphs of the file
+    def get_stack(self):
+        # padded tensors of every graph, built on the first call
+        if self._stack is None:
+            self._stack = GraphStack(self.graph_list)
+        return self._stack
+
+    def get_elig_batch(self, graph_indices, completions):
+        # eligibility of (graph_indices[i], completions[i]) pairs, in subtask
+        # index space. Does not change the current graph.
+        return self.get_stack().get_elig(graph_indices, completions)
+
     # rendering
     def draw_graph(self, config, rewards, colors):
+        # (H, W, 3) uint8 image of the graph with the subtask nodes filled by
+        # colors ('white': not filled). The layout is computed once per graph.
+        key = (self.graph_index, tuple(rewards))
+        if key in self._layout_cache:
+            self._layout_cache.move_to_end(key)
+        else:
+            self._layout_cache[key] = GraphLayout(
+                lambda **attr: self._build_digraph(config, rewards, **attr),
+                self.nb_subtask)
+            if len(self._layout_cache) > LAYOUT_CACHE_SIZE:
+                self._layout_cache.popitem(last=False)
+        return self._layout_cache[key].draw(colors)
+
+    def _build_digraph(self, config, rewards, **or_attr):
+        # or_attr: extra attributes of every subtask (OR) node
         from graphviz import Digraph
         root = os.path.join(__PATH__, 'asset', config.env_name)
-        g = Digraph(comment='subtask graph', format='png',
-                    filename='./render/temp/subtask_graph')
-        g.attr(nodesep="0.1", ranksep=config.ranksep)
+        g = Digraph(comment='subtask graph', format='png')
+        g.attr(nodesep="0.1", ranksep=config.ranksep, dpi=str(GraphLayout.DPI))
         g.node_attr.update(fontsize="14", fontname='Arial')
         # 1. add Or nodes in the first layer
         for ind in range(self.numP[0]):
             sub_id = self.ind_to_id[ind]
             label = '\n{:+1.2f}'.format(rewards[ind])
-            if colors[ind] == 'white':
-                g.node('OR'+str(ind), label, shape='rect', margin="0,0", height="0",
-                       width="0", image=root+'/subtask{:02d}.png'.format(sub_id))
-            else:
-                g.node('OR'+str(ind), label, shape='rect', margin="0,0", height="0", width="0", image=root +
-                       '/subtask{:02d}.png'.format(sub_id), style='filled', color=colors[ind])
+            g.node('OR'+str(ind), label, shape='rect', margin="0,0", height="0",
+                   width="0", image=root+'/subtask{:02d}.png'.format(sub_id), **or_attr)
 
         abias, obias = 0, self.numP[0]
         for lind in range(self.num_level):
@@ -115,11 +238,8 @@ class SubtaskGraph(object):
                 ind = i + obias
                 sub_id = self.ind_to_id[ind]
                 label = '\n{:+1.2f}'.format(rewards[ind])
-                if colors[ind] == 'white':
-                    g.node('OR'+str(ind), label, shape='rect', margin="0,0", width="0", height="0", image=root+'/subtask{:02d}.png'.format(sub_id))
-                else:
-                    g.node('OR'+str(ind), label, shape='rect', margin="0,0", width="0", height="0", image=root +
-                           '/subtask{:02d}.png'.format(sub_id), style='filled', color=colors[ind])
+                g.node('OR'+str(ind), label, shape='rect', margin="0,0", width="0", height="0",
+                       image=root+'/subtask{:02d}.png'.format(sub_id), **or_attr)
 
             # Edge AND->OR
             left, right = Omat.nonzero()
@@ -130,4 +250,341 @@ class SubtaskGraph(object):
                        arrowsize="0.7", arrowhead="odiamond")
             abias += Na
             obias += No
-        g.render()
+        return g
+
+
+class GraphStack(object):
+    """Every graph of a graph list stacked into tensors padded to the largest
+    graph (num_graph, ...), in subtask index space: ANDmat (nb_and, nb_ind),
+    b_AND (nb_and), ORmat (nb_ind, nb_and), b_OR (nb_ind), rew_mag and
+    ind_to_id (nb_ind, -1 for padding). node_mask / and_mask are True for the
+    actual subtask / AND nodes. The padded AND nodes are always on and the
+    padded subtasks have no AND input, so they do not change the
+    eligibility of the actual subtasks. The graph tensors are int8 (cast to
+    float32 per batch), so that large generated sets fit in memory."""
+    def __init__(self, graph_list):
+        from . import graphpack
+        if isinstance(graph_list, graphpack.PackedGraphList):
+            # read the flat arrays directly
+            self.ANDmat = graph_list.get_padded('and', np.int8)
+            self.ORmat = graph_list.get_padded('or', np.int8)
+            self.rew_mag = graph_list.get_padded_subtasks('rmag')
+            self.ind_to_id = graph_list.get_padded_subtasks('trind', -1, np.int64)
+            nb_and = graph_list.and_shape[:, 0]
+            nb_ind = np.diff(graph_list.sub_offset)
+            nb_first = graph_list.wa_shape[graph_list.level_offset[:-1], 1]
+        else:
+            graphs = [graph_list[i] for i in range(len(graph_list))]
+            nb_and = np.array([graph['ANDmat'].shape[0] for graph in graphs])
+            nb_ind = np.array([len(graph['trind']) for graph in graphs])
+            nb_first = np.array([graph['W_a'][0].shape[1] for graph in graphs])
+            G, A, T = len(graphs), nb_and.max(), nb_ind.max()
+            self.ANDmat = np.zeros((G, A, T), dtype=np.int8)
+            self.ORmat = np.zeros((G, T, A), dtype=np.int8)
+            self.rew_mag = np.zeros((G, T))
+            self.ind_to_id = np.full((G, T), -1, dtype=np.int64)
+            for i, graph in enumerate(graphs):
+                na, nt = nb_and[i], nb_ind[i]
+                self.ANDmat[i, :na, :nt] = graph['ANDmat']
+                self.ORmat[i, :nt, :na] = graph['ORmat']
+                self.rew_mag[i, :nt] = graph['rmag']
+                self.ind_to_id[i, :nt] = graph['trind']
+        G, A, T = self.ANDmat.shape
+        self.num_graph = G
+        self.nb_and, self.nb_subtask = nb_and, nb_ind
+        self.and_mask = np.arange(A) < nb_and[:, None]
+        self.node_mask = np.arange(T) < nb_ind[:, None]
+        self.b_AND = np.not_equal(self.ANDmat, 0).sum(2).astype(np.int16)
+        # the subtasks of the first layer are always eligible
+        self.b_OR = (np.arange(T) >= nb_first[:, None]).astype(np.int16)
+        self.b_OR[~self.node_mask] = 0
+
+    def get_elig(self, graph_indices, completions):
+        # completions: (batch, nb_ind) (or fewer columns, padded with 0)
+        # returns (batch, nb_ind) bool, False for the padded subtasks
+        graph_indices = np.asarray(graph_indices)
+        completions = np.asarray(completions)
+        T = self.node_mask.shape[1]
+        tp = np.full(completions.shape[:-1] + (T,), -1, dtype=np.float32)
+        tp[..., :completions.shape[-1]] = (completions != 0) * 2 - 1  # \in {-1,1}
+        # sign(A x tp + b) (+1 or 0)
+        ANDout = np.matmul(self.ANDmat[graph_indices].astype(np.float32),
+                           tp[..., None])[..., 0] \
+            - self.b_AND[graph_indices] >= 0
+        ORout = np.matmul(self.ORmat[graph_indices].astype(np.float32),
+                          ANDout[..., None].astype(np.float32))[..., 0] \
+            - self.b_OR[graph_indices] >= 0
+        return ORout & self.node_mask[graph_indices]
+
+    def to_id_space(self, max_task):
+        # (ANDmat, ORmat, b_OR, rew_mag, present) with the subtask axis in
+        # subtask id space (max_task) instead of index space
+        g, ind = self.node_mask.nonzero()
+        ids = self.ind_to_id[g, ind]
+        G, A = self.ANDmat.shape[:2]
+        ANDmat = np.zeros((G, A, max_task), dtype=self.ANDmat.dtype)
+        ORmat = np.zeros((G, max_task, A), dtype=self.ORmat.dtype)
+        b_OR = np.zeros((G, max_task), dtype=self.b_OR.dtype)
+        rew_mag = np.zeros((G, max_task))
+        present = np.zeros((G, max_task), dtype=np.bool_)
+        ANDmat[g, :, ids] = self.ANDmat[g, :, ind]
+        ORmat[g, ids] = self.ORmat[g, ind]
+        b_OR[g, ids] = self.b_OR[g, ind]
+        rew_mag[g, ids] = self.rew_mag[g, ind]
+        present[g, ids] = True
+        return ANDmat, ORmat, b_OR, rew_mag, present
+
+
+class GraphLayout(object):
+    """Pre-rendered subtask graph whose node fills can be recolored in memory.
+
+    dot is run once: the node boxes come from the 'plain' layout, and three
+    renders (unfilled, black fill and border, white border) give for every
+    pixel of a node its fill coverage a_f and border coverage a_b. A node
+    filled with color c is then base + a_f * (c - 255) + a_b * c, which is
+    what dot draws for style='filled', color=c.
+    """
+    DPI = 96
+    MARGIN = 3  # pixels around the node boxes
+
+    def __init__(self, build, nb_node):
+        # build(**or_attr) -> graphviz.Digraph
+        self.nb_node = nb_node
+        base = _pipe_png(build())
+        black = _pipe_png(build(style='filled', color='black'))
+        white = _pipe_png(build(style='filled', color='white'))
+        self.base = np.round(base).astype(np.uint8)
+        self.shape = base.shape
+        fill = (base - black) / 255.
+        border = (white - base) / 255.
+        boxes = _node_boxes(build().pipe(format='plain'), self.shape, self.DPI)
+
+        # pixels of each node that depend on its color
+        H, W = self.shape[:2]
+        index, node = [], []
+        for k in range(nb_node):
+            r0, r1, c0, c1 = boxes['OR'+str(k)]
+            r0, c0 = max(r0 - self.MARGIN, 0), max(c0 - self.MARGIN, 0)
+            r1, c1 = min(r1 + self.MARGIN, H), min(c1 + self.MARGIN, W)
+            rows, cols = (np.abs(fill[r0:r1, c0:c1]).sum(-1) +
+                          np.abs(border[r0:r1, c0:c1]).sum(-1) > 0).nonzero()
+            index.append((rows + r0) * W + cols + c0)
+            node.append(np.full(len(rows), k))
+        index, node = np.concatenate(index), np.concatenate(node)
+        index, first = np.unique(index, return_index=True)  # boxes may touch
+        self.index, self.node = index, node[first]
+        self.base_px = base.reshape(H * W, 3)[index]
+        self.fill_px = fill.reshape(H * W, 3)[index]
+        self.border_px = border.reshape(H * W, 3)[index]
+        self._rgb = dict()
+
+    def draw(self, colors, out=None):
+        fill_delta = np.zeros((self.nb_node, 3))
+        border_delta = np.zeros((self.nb_node, 3))
+        for k, color in enumerate(colors):
+            if color != 'white':
+                rgb = self._to_rgb(color)
+                fill_delta[k] = rgb - 255
+                border_delta[k] = rgb
+        node = self.node
+        pixels = self.base_px + self.fill_px * fill_delta[node] + \
+            self.border_px * border_delta[node]
+        if out is None:
+            out = self.base.copy()
+        else:
+            out[...] = self.base
+        out.reshape(-1, 3)[self.index] = np.clip(np.round(pixels), 0, 255)
+        return out
+
+    def _to_rgb(self, color):
+        if color not in self._rgb:
+            import matplotlib.colors
+            self._rgb[color] = np.array(matplotlib.colors.to_rgb(color)) * 255
+        return self._rgb[color]
+
+
+def _pipe_png(g):
+    # render in memory to a float (H, W, 3) array in [0, 255] on white
+    import io
+    import matplotlib.image
+    img = matplotlib.image.imread(io.BytesIO(g.pipe(format='png')), format='png')
+    img = img * 255. if img.dtype != np.uint8 else img.astype(np.float64)
+    if img.shape[2] == 4:
+        alpha = img[..., 3:] / 255.
+        img = img[..., :3] * alpha + 255. * (1 - alpha)
+    return img
+
+
+def _node_boxes(plain, shape, dpi):
+    # node name -> (row0, row1, col0, col1) pixel box from dot's plain output
+    # ('graph scale width height' and 'node name x y width height ...' in
+    # inches, y upward, the image has a pad on every side)
+    boxes = dict()
+    scale = dpi / 72.
+    for line in plain.decode('utf-8').splitlines():
+        tokens = line.split()
+        if tokens[0] == 'graph':
+            gw, gh = float(tokens[2]) * 72, float(tokens[3]) * 72
+            pad_x = (shape[1] / scale - gw) / 2
+            pad_y = (shape[0] / scale - gh) / 2
+        elif tokens[0] == 'node':
+            x, y, w, h = [float(t) * 72 for t in tokens[2:6]]
+            col, row = (x + pad_x) * scale, (gh - y + pad_y) * scale
+            w, h = w * scale / 2, h * scale / 2
+            boxes[tokens[1]] = (int(row - h), int(np.ceil(row + h)),
+                                int(col - w), int(np.ceil(col + w)))
+    return boxes
+
+
+class SparseGraph(object):
+    """Subtask graph in compressed sparse row (CSR) form, in subtask index
+    space. Memory and the cost of get_elig are linear in the number of edges.
+
+    AND node j has the inputs and_ind[and_ptr[j]:and_ptr[j+1]] (subtask
+    indices, and_neg: NOT edge), and subtask i has the inputs
+    or_ind[or_ptr[i]:or_ptr[i+1]] (AND node indices). The transposed lists
+    (children of each subtask and of each AND node) are used by
+    EligibilityEngine.
+    """
+    def __init__(self, nb_subtask, and_ptr, and_ind, and_neg, or_ptr, or_ind, b_OR):
+        self.nb_subtask = nb_subtask
+        self.nb_and = len(and_ptr) - 1
+        self.and_ptr = np.asarray(and_ptr, dtype=np.int64)
+        self.and_ind = np.asarray(and_ind, dtype=np.int32)
+        self.and_neg = np.asarray(and_neg, dtype=np.bool_)
+        self.or_ptr = np.asarray(or_ptr, dtype=np.int64)
+        self.or_ind = np.asarray(or_ind, dtype=np.int32)
+        self.b_OR = np.asarray(b_OR, dtype=np.int8)
+        self.and_row = _csr_rows(self.and_ptr)
+        self.or_row = _csr_rows(self.or_ptr)
+
+        # transposed: subtask -> AND nodes, AND node -> subtasks
+        order = np.argsort(self.and_ind, kind='stable')
+        self.child_ptr = _csr_ptr(self.and_ind, nb_subtask)
+        self.child_and = self.and_row[order]
+        self.child_neg = self.and_neg[order]
+        order = np.argsort(self.or_ind, kind='stable')
+        self.and_child_ptr = _csr_ptr(self.or_ind, self.nb_and)
+        self.and_child_ind = self.or_row[order]
+
+    @classmethod
+    def from_dense(cls, ANDmat, ORmat, b_OR):
+        # ANDmat (nb_and, nb_subtask) in {-1,0,1}, ORmat (nb_subtask, nb_and)
+        # in {0,1}, b_OR in {0,1}
+        if not (np.isin(ANDmat, (-1, 0, 1)).all() and np.isin(ORmat, (0, 1)).all()
+                and np.isin(b_OR, (0, 1)).all()):
+            raise ValueError('SparseGraph requires ANDmat in {-1,0,1} and ORmat in {0,1}')
+        nb_and, nb_subtask = ANDmat.shape
+        rows, cols = ANDmat.nonzero()
+        or_rows, or_cols = ORmat.nonzero()
+        return cls(nb_subtask, _csr_ptr(rows, nb_and), cols, ANDmat[rows, cols] < 0,
+                   _csr_ptr(or_rows, nb_subtask), or_cols, b_OR)
+
+    @property
+    def nb_edge(self):
+        return len(self.and_ind) + len(self.or_ind)
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in vars(self).values()
+                   if isinstance(arr, np.ndarray))
+
+    def get_and_unsat(self, completion):
+        # number of unsatisfied inputs of each AND node (incomplete subtask on
+        # a solid edge, complete subtask on a NOT edge)
+        comp = np.asarray(completion) != 0
+        unsat = comp[self.and_ind] == self.and_neg
+        return np.bincount(self.and_row, unsat, self.nb_and).astype(np.int64)
+
+    def get_or_count(self, and_out):
+        # number of AND inputs that are on of each subtask
+        return np.bincount(
+            self.or_row, and_out[self.or_ind], self.nb_subtask).astype(np.int64)
+
+    def get_elig(self, completion):
+        # same as SubtaskGraph.get_elig: AND node is on iff all its inputs
+        # are satisfied, subtask is eligible iff >= b_OR of its AND inputs are on
+        and_out = self.get_and_unsat(completion) == 0
+        return self.get_or_count(and_out) >= self.b_OR
+
+    def get_elig_set(self, completed):
+        # completed / returned: subtask index sets (sorted index arrays)
+        completion = np.zeros(self.nb_subtask, dtype=np.bool_)
+        completion[np.asarray(completed, dtype=np.int64)] = True
+        return np.flatnonzero(self.get_elig(completion))
+
+    def to_dense(self):
+        # (ANDmat, ORmat, b_AND, b_OR) of SubtaskGraph
+        ANDmat = np.zeros((self.nb_and, self.nb_subtask))
+        ANDmat[self.and_row, self.and_ind] = np.where(self.and_neg, -1, 1)
+        ORmat = np.zeros((self.nb_subtask, self.nb_and))
+        ORmat[self.or_row, self.or_ind] = 1
+        b_AND = np.diff(self.and_ptr).astype(np.float64)
+        return ANDmat, ORmat, b_AND, self.b_OR.astype(np.float64)
+
+
+class EligibilityEngine(object):
+    """Incremental version of SubtaskGraph.get_elig.
+
+    AND node j counts its unsatisfied inputs (incomplete parent on a solid
+    edge, complete parent on a dashed edge) and is on iff the count is 0.
+    OR node i counts its AND nodes that are on and is eligible iff the count
+    is >= b_OR[i]. With ANDmat in {-1,0,1} and ORmat in {0,1} this is exactly
+    the sign(ANDmat x tp - b_AND), sign(ORmat x ANDout - b_OR) formula, and a
+    completion flip only touches the nodes downstream of the subtask.
+    The graph is a SparseGraph, so memory is linear in the number of edges.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.nb_subtask = graph.nb_subtask
+        self.b_OR = graph.b_OR.tolist()
+
+        # flat adjacency lists: subtask -> (AND node, solid edge), AND node -> OR nodes
+        self.child_ptr = graph.child_ptr.tolist()
+        self.child_and = graph.child_and.tolist()
+        self.child_solid = (~graph.child_neg).tolist()
+        self.and_child_ptr = graph.and_child_ptr.tolist()
+        self.and_child_ind = graph.and_child_ind.tolist()
+
+    def reset(self, completion):
+        unsat = self.graph.get_and_unsat(completion)
+        or_count = self.graph.get_or_count(unsat == 0)
+        self.completion = (np.asarray(completion) != 0).tolist()
+        self.unsat = unsat.tolist()
+        self.or_count = or_count.tolist()
+        self.elig = or_count >= self.graph.b_OR
+        return self.elig
+
+    def update(self, sub_ind, completed):
+        if self.completion[sub_ind] == completed:
+            return self.elig, []
+        changed = dict()  # OR node -> eligibility before the update
+        self.completion[sub_ind] = completed
+        unsat, or_count, elig, b_OR = self.unsat, self.or_count, self.elig, self.b_OR
+        child_and, child_solid = self.child_and, self.child_solid
+        and_child_ptr, and_child_ind = self.and_child_ptr, self.and_child_ind
+        for k in range(self.child_ptr[sub_ind], self.child_ptr[sub_ind+1]):
+            j = child_and[k]
+            was_on = unsat[j] == 0
+            unsat[j] += -1 if child_solid[k] == completed else 1
+            is_on = unsat[j] == 0
+            if was_on == is_on:
+                continue
+            delta = 1 if is_on else -1
+            for m in range(and_child_ptr[j], and_child_ptr[j+1]):
+                i = and_child_ind[m]
+                or_count[i] += delta
+                e = or_count[i] >= b_OR[i]
+                if e != elig[i]:
+                    changed.setdefault(i, elig[i])
+                    elig[i] = e
+        return elig, [i for i, e in changed.items() if elig[i] != e]
+
+
+def _csr_ptr(rows, nb_row):
+    # row pointer of the entries sorted by row
+    return np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=nb_row))])
+
+
+def _csr_rows(ptr):
+    return np.repeat(np.arange(len(ptr)-1, dtype=np.int32), np.diff(ptr))
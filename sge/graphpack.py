@@ -0,0 +1,339 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+
+__PATH__ = os.path.abspath(os.path.dirname(__file__))
+
+# Packed subtask graph file (.sgpack)
+#   MAGIC | header length (uint64) | json header | arrays (ALIGN-byte aligned)
+# Each graph field is stored as flat concatenated data plus an offset index,
+# so that a graph can be read from a memory-mapped file without unpickling.
+# The matrices (and: ANDmat, or: ORmat, wa: W_a, wo: W_o) are stored in CSR
+# form (<name>_ptr: row pointers, <name>_ind: column indices, <name>_val:
+# values of the nonzero entries), so the file size is linear in the edges.
+MAGIC = b'SGPACK02'
+ALIGN = 64
+EXT = '.sgpack'
+MATRICES = ['and', 'or', 'wa', 'wo']
+# arrays streamed by GraphPackWriter (the offsets are computed by close);
+# <name>_val has the dtype of the matrices
+SPILL_DTYPES = dict(nb_level=np.int64, nb_sub=np.int64, rmag=np.float64,
+                    trind=np.int32)
+for _name in MATRICES:
+    SPILL_DTYPES.update({_name+'_shape': np.int64, _name+'_ptr': np.int32,
+                         _name+'_ind': np.int32, _name+'_val': None,
+                         _name+'_nnz': np.int64, _name+'_nptr': np.int64})
+SPILL_NAMES = sorted(SPILL_DTYPES)
+# sizes only used to compute the offsets
+COUNT_NAMES = ['nb_level', 'nb_sub'] + [name+suffix for name in MATRICES
+                                         for suffix in ['_nnz', '_nptr']]
+
+
+class PackedGraphList(object):
+    """Read-only, memory-mapped list of subtask graphs. Indexing returns the
+    same dict as the pickled .npy files (ANDmat, ORmat, W_a, W_o, rmag, trind)
+    and only touches the pages of that graph."""
+    def __init__(self, fname):
+        self.fname = fname
+        buf = np.memmap(fname, dtype=np.uint8, mode='r')
+        magic = bytes(buf[:len(MAGIC)])
+        if magic != MAGIC:
+            if magic[:6] == MAGIC[:6]:
+                raise ValueError('Outdated packed subtask graph file: {} (convert '
+                                 'it again with python -m sge.graphpack)'.format(fname))
+            raise ValueError('Not a packed subtask graph file: {}'.format(fname))
+        hlen = int(buf[len(MAGIC):len(MAGIC)+8].view('<u8')[0])
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(buf[start:start+hlen]).decode('utf-8'))
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            nbytes = int(np.prod(spec['shape'])) * dtype.itemsize
+            offset = spec['offset']
+            arr = buf[offset:offset+nbytes].view(dtype).reshape(spec['shape'])
+            setattr(self, name, arr)
+        self.num_graph = header['num_graph']
+
+    def __len__(self):
+        return self.num_graph
+
+    def __iter__(self):
+        for i in range(self.num_graph):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.num_graph
+        if not 0 <= i < self.num_graph:
+            raise IndexError('graph index out of range')
+        rmag, trind = self.get_subtasks(i)
+        graph = dict(
+            ANDmat=self.get_matrix('and', i),
+            ORmat=self.get_matrix('or', i),
+            rmag=rmag,
+            trind=trind,
+        )
+        levels = range(self.level_offset[i], self.level_offset[i+1])
+        graph['W_a'] = [self.get_matrix('wa', lv) for lv in levels]
+        graph['W_o'] = [self.get_matrix('wo', lv) for lv in levels]
+        return graph
+
+    def get_csr(self, name, i):
+        # (row pointers, column indices, values) of the i-th 'and', 'or',
+        # 'wa' or 'wo' matrix (views of the file)
+        ptr_offset = getattr(self, name+'_ptr_offset')
+        offset = getattr(self, name+'_offset')
+        s, e = offset[i], offset[i+1]
+        return (getattr(self, name+'_ptr')[ptr_offset[i]:ptr_offset[i+1]],
+                getattr(self, name+'_ind')[s:e], getattr(self, name+'_val')[s:e])
+
+    def get_level_shapes(self, i):
+        # shapes of W_a and W_o of each level of graph i
+        levels = slice(self.level_offset[i], self.level_offset[i+1])
+        return self.wa_shape[levels].tolist(), self.wo_shape[levels].tolist()
+
+    def get_subtasks(self, i):
+        # rmag (list) and trind of graph i
+        s, e = self.sub_offset[i], self.sub_offset[i+1]
+        return self.rmag[s:e].tolist(), np.array(self.trind[s:e])
+
+    def get_padded(self, name, dtype=np.float64, chunk_size=2**16):
+        # (num_graph, max rows, max cols) zero-padded stack of the 'and' or
+        # 'or' matrices of all the graphs, without reading them one by one
+        shape = getattr(self, name+'_shape')
+        ptr_offset = getattr(self, name+'_ptr_offset')
+        offset = getattr(self, name+'_offset')
+        out = np.zeros((self.num_graph,) + tuple(shape.max(0)), dtype=dtype)
+        for start in range(0, self.num_graph, chunk_size):
+            end = min(start + chunk_size, self.num_graph)
+            ptr = getattr(self, name+'_ptr')[ptr_offset[start]:ptr_offset[end]]
+            # row of every entry: the rows of the graphs are consecutive in ptr
+            nb_row = shape[start:end, 0]
+            last = np.cumsum(nb_row + 1) - 1  # last pointer of each graph
+            counts = np.delete(np.diff(ptr), last[:-1])
+            row = np.repeat(np.arange(counts.size) -
+                            np.repeat(np.cumsum(nb_row) - nb_row, nb_row), counts)
+            g = np.repeat(np.arange(start, end), np.diff(offset[start:end+1]))
+            out[g, row, getattr(self, name+'_ind')[offset[start]:offset[end]]] = \
+                getattr(self, name+'_val')[offset[start]:offset[end]]
+        return out
+
+    def get_padded_subtasks(self, name, fill=0, dtype=np.float64):
+        # (num_graph, max nb_subtask) stack of 'rmag' or 'trind'
+        sizes = np.diff(self.sub_offset)
+        out = np.full((self.num_graph, sizes.max()), fill, dtype=dtype)
+        out[np.arange(sizes.max()) < sizes[:, None]] = getattr(self, name)
+        return out
+
+    def get_matrix(self, name, i):
+        # dense i-th 'and', 'or', 'wa' or 'wo' matrix
+        ptr, ind, val = self.get_csr(name, i)
+        mat = np.zeros(getattr(self, name+'_shape')[i], dtype=val.dtype)
+        mat[np.repeat(np.arange(len(ptr)-1), np.diff(ptr)), ind] = val
+        return mat
+
+
+class GraphPackWriter(object):
+    """Streams subtask graphs into a packed file. Graphs are added one by one
+    (add), as a list (add_graphs) or as a flat batch of the packed arrays
+    (add_batch, see flatten_graphs). The arrays are spilled to temporary files
+    next to fname, so memory does not grow with the number of graphs, and
+    close() assembles them into fname."""
+    def __init__(self, fname, dtype=np.int8):
+        self.fname = fname
+        self.dtype = np.dtype(dtype)  # of the matrices
+        self.num_graph = 0
+        self._dir = tempfile.mkdtemp(
+            prefix=os.path.basename(fname) + '.',
+            dir=os.path.dirname(os.path.abspath(fname)))
+        self._spills = dict()  # name -> [file, dtype, count]
+
+    def add(self, graph):
+        self.add_graphs([graph])
+
+    def add_graphs(self, graph_list):
+        if len(graph_list) > 0:
+            self.add_batch(flatten_graphs(graph_list, self.dtype))
+
+    def add_batch(self, batch):
+        # batch: dict of flat arrays (and_shape, and_data, ..., nb_level,
+        # nb_sub, rmag, trind), see flatten_graphs. The dense <name>_data of
+        # the matrices are stored in CSR form.
+        for name in MATRICES:
+            shape = np.asarray(batch[name+'_shape'], dtype=np.int64).reshape(-1, 2)
+            ptr, ind, val = _to_csr(shape, np.asarray(batch[name+'_data'], dtype=self.dtype))
+            self._spill(name+'_shape', shape)
+            self._spill(name+'_ptr', ptr.astype(np.int32))
+            self._spill(name+'_ind', ind.astype(np.int32))
+            self._spill(name+'_val', val)
+            self._spill(name+'_nnz', ptr[np.cumsum(shape[:, 0] + 1) - 1])
+            self._spill(name+'_nptr', shape[:, 0] + 1)
+        for name in ['nb_level', 'nb_sub', 'rmag', 'trind']:
+            self._spill(name, np.asarray(batch[name], dtype=SPILL_DTYPES[name]))
+        self.num_graph += len(batch['nb_level'])
+
+    def close(self):
+        if self._dir is None:
+            return
+        try:
+            self._write()
+        finally:
+            for f, _, _ in self._spills.values():
+                f.close()
+            shutil.rmtree(self._dir)
+            self._dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # internal
+    def _spill(self, name, arr):
+        if name not in self._spills:
+            f = open(os.path.join(self._dir, name), 'w+b')
+            self._spills[name] = [f, arr.dtype, 0]
+        spill = self._spills[name]
+        arr.tofile(spill[0])
+        spill[2] += arr.size
+
+    def _offsets(self, name, sizes):
+        # running sum of sizes (read back from a spill file) into a new spill
+        offset = 0
+        self._spill(name, np.zeros(1, dtype=np.int64))
+        for chunk in self._read(sizes):
+            chunk = offset + np.cumsum(chunk, dtype=np.int64)
+            self._spill(name, chunk)
+            offset = chunk[-1]
+
+    def _read(self, name, chunk_size=2**20):
+        # yields the spilled array by chunks
+        f, dtype, count = self._spills[name]
+        f.flush()
+        f.seek(0)
+        width = 2 if name.endswith('_shape') else 1
+        while count > 0:
+            n = min(count, chunk_size * width)
+            chunk = np.fromfile(f, dtype=dtype, count=n)
+            yield chunk.reshape(-1, 2) if width == 2 else chunk
+            count -= n
+
+    def _write(self):
+        for name in SPILL_NAMES:
+            if name not in self._spills:  # no graph
+                dtype = SPILL_DTYPES[name] or self.dtype
+                self._spill(name, np.zeros(0, dtype=dtype))
+        for name in MATRICES:
+            self._offsets(name+'_offset', name+'_nnz')
+            self._offsets(name+'_ptr_offset', name+'_nptr')
+        self._offsets('level_offset', 'nb_level')
+        self._offsets('sub_offset', 'nb_sub')
+        names = sorted(set(self._spills) - set(COUNT_NAMES))
+        shapes = dict()
+        for name in names:
+            count = self._spills[name][2]
+            shapes[name] = [count // 2, 2] if name.endswith('_shape') else [count]
+
+        # 1. layout
+        header = dict(num_graph=self.num_graph, arrays=dict())
+        # header size depends on the offsets, so reserve space for them first
+        for name in names:
+            header['arrays'][name] = dict(
+                dtype=self._spills[name][1].str, shape=shapes[name], offset=2**40)
+        hlen = len(json.dumps(header).encode('utf-8'))
+        offset = _align(len(MAGIC) + 8 + hlen)
+        for name in names:
+            header['arrays'][name]['offset'] = offset
+            nbytes = self._spills[name][2] * self._spills[name][1].itemsize
+            offset = _align(offset + nbytes)
+        hbytes = json.dumps(header).encode('utf-8').ljust(hlen)
+
+        # 2. write
+        with open(self.fname, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.array(hlen, dtype='<u8').tobytes())
+            f.write(hbytes)
+            for name in names:
+                f.write(b'\0' * (header['arrays'][name]['offset'] - f.tell()))
+                spill = self._spills[name][0]
+                spill.flush()
+                spill.seek(0)
+                shutil.copyfileobj(spill, f)
+
+
+def flatten_graphs(graph_list, dtype=np.int8):
+    # graph dicts (as in the .npy files) -> flat batch of GraphPackWriter
+    batch = dict()
+    for name, key in [('and', 'ANDmat'), ('or', 'ORmat')]:
+        _add_mats(batch, name, [graph[key] for graph in graph_list], dtype)
+    _add_mats(batch, 'wa', [w for graph in graph_list for w in graph['W_a']], dtype)
+    _add_mats(batch, 'wo', [w for graph in graph_list for w in graph['W_o']], dtype)
+    batch['nb_level'] = np.array([len(graph['W_a']) for graph in graph_list])
+    batch['nb_sub'] = np.array([len(graph['trind']) for graph in graph_list])
+    batch['rmag'] = np.array(
+        [r for graph in graph_list for r in graph['rmag']], dtype=np.float64)
+    batch['trind'] = np.array(
+        [t for graph in graph_list for t in graph['trind']], dtype=np.int32)
+    return batch
+
+
+def pack_graph_list(graph_list, fname):
+    dtype = graph_list[0]['ANDmat'].dtype if len(graph_list) > 0 else np.int8
+    with GraphPackWriter(fname, dtype) as writer:
+        writer.add_graphs(graph_list)
+
+
+def convert_npy(src, dst=None):
+    if dst is None:
+        dst = os.path.splitext(src)[0] + EXT
+    graph_list = np.load(src, allow_pickle=True)
+    pack_graph_list(graph_list, dst)
+    return dst
+
+
+def _add_mats(batch, name, mats, dtype):
+    batch[name+'_shape'] = np.array(
+        [mat.shape for mat in mats], dtype=np.int64).reshape(-1, 2)
+    if len(mats) > 0:
+        batch[name+'_data'] = np.concatenate(
+            [np.asarray(mat, dtype=dtype).ravel() for mat in mats])
+    else:
+        batch[name+'_data'] = np.zeros(0, dtype=dtype)
+
+
+def _to_csr(shape, data):
+    # concatenated dense matrices of the given (rows, cols) shapes -> CSR
+    # (row pointers of each matrix from 0, column indices, values)
+    size = shape.prod(1)
+    nz = np.flatnonzero(data)
+    mat = np.repeat(np.arange(len(shape)), size)[nz]
+    local = nz - (np.cumsum(size) - size)[mat]
+    cols = shape[mat, 1]
+    first_row = np.cumsum(shape[:, 0]) - shape[:, 0]
+    counts = np.bincount(first_row[mat] + local // cols,
+                         minlength=int(shape[:, 0].sum()))
+    # a 0 before the rows of each matrix, then the running count
+    ptr = np.cumsum(np.insert(counts, first_row, 0))
+    ptr -= np.repeat(ptr[first_row + np.arange(len(shape))], shape[:, 0] + 1)
+    return ptr, local % cols, data[nz]
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    parser = argparse.ArgumentParser(
+        description='Convert pickled subtask graph files (.npy) to ' + EXT)
+    parser.add_argument('files', nargs='*',
+                        help='.npy files to convert (default: all in sge/data)')
+    args = parser.parse_args()
+
+    files = args.files or sorted(
+        glob.glob(os.path.join(__PATH__, 'data', '*', '*.npy')))
+    for src in files:
+        print('{} -> {}'.format(src, convert_npy(src)))
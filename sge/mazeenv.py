@@ -2,25 +2,39 @@ import os
 import sys
 from .graph import SubtaskGraph
 from sge.mazemap import Mazemap
+from sge.gametables import action_code
+from sge.obsencoding import ObsEncoder
 import numpy as np
-from .utils import get_id_from_ind_multihot
+from .profiler import Profiler, NULL_PROFILER
 from sge.utils import WHITE, BLACK, DARK, LIGHT, GREEN, DARK_RED
 
 
+def load_game_config(game_name, graph_param):
+    if game_name == 'playground':
+        from sge.playground import Playground
+        game_config = Playground()
+        graph_folder = os.path.join('.', 'data', 'subtask_graph_play')
+        filename = 'play_{param}'.format(param=graph_param)
+
+    elif game_name == 'mining':
+        from sge.mining import Mining
+        game_config = Mining()
+        graph_folder = os.path.join('.', 'data', 'subtask_graph_mining')
+        filename = 'mining_{param}'.format(param=graph_param)
+    else:
+        raise ValueError("Unsupported : {}".format(game_name))
+    return game_config, graph_folder, filename
+
+
 class MazeEnv(object):  # single batch
-    def __init__(self, game_name, graph_param, game_len, gamma, render_config={}):
-        if game_name == 'playground':
-            from sge.playground import Playground
-            game_config = Playground()
-            graph_folder = os.path.join('.', 'data', 'subtask_graph_play')
-            filename = 'play_{param}'.format(param=graph_param)
-
-        elif game_name == 'mining':
-            from sge.mining import Mining
-            game_config = Mining()
-            graph_folder = os.path.join('.', 'data', 'subtask_graph_mining')
-            filename = 'mining_{param}'.format(param=graph_param)
+    def __init__(self, game_name, graph_param, game_len, gamma, render_config={},
+                 elig_engine='matrix', profile=False, state_dtype=None, seed=None,
+                 obs_encoding='onehot'):
+        game_config, graph_folder, filename = load_game_config(
+            game_name, graph_param)
 
+        self.game_name = game_name
+        self.graph_param = graph_param
         self.config = game_config
         self.max_task = self.config.nb_subtask_type
         self.subtask_list = self.config.subtask_list
@@ -31,56 +45,94 @@ class MazeEnv(object):  # single batch
 
         # graph & map
         self.graph = SubtaskGraph(
-            graph_folder, filename, self.max_task)  # just load all graph
+            graph_folder, filename, self.max_task, elig_engine)  # just load all graph
         self.map = Mazemap(game_name, game_config, render_config)
+        self.obs_encoder = ObsEncoder(obs_encoding, self.map.obs.shape)
         self.gamma = gamma
 
         # init
-        self.game_length = int(np.random.uniform(
+        self.seed(seed)
+        self.game_length = int(self.rng.uniform(
             0.8, 1.2) * game_len)
         self.step_reward = 0.0
+        self.enable_profiling(profile)
+        self.snapshot_dtype = np.dtype(self.map.snapshot_fields() + [
+            ('graph_index', np.int64), ('game_length', np.int64),
+            ('step_count', np.int64), ('ret', np.float64), ('reward', np.float64),
+            ('game_over', np.bool_), ('time_over', np.bool_),
+            ('executed_sub_ind', np.int64),
+            ('mask', np.uint8, (self.max_task,)),
+            ('completion', np.int8, (self.max_task,)),
+            ('eligibility', np.bool_, (self.max_task,)),
+            ('mask_id', np.uint8, (self.max_task,)),
+            ('comp_id', np.uint8, (self.max_task,)),
+            ('elig_id', np.int8, (self.max_task,)),
+            ('rng', np.uint64, (6,))])  # see _pack_rng_state
+
+        # env-owned state buffer (reused by every step/reset) if state_dtype
+        self.state_buffer = None
+        if state_dtype is not None:
+            self.state_buffer = self.new_state_buffer(state_dtype)
 
-    def step(self, action):
-        if self.graph.graph_index is None:
+    def seed(self, seed=None):
+        # seed: None, int or np.random.SeedSequence (e.g. spawned children)
+        self.rng = np.random.default_rng(seed)
+        self.map.rng = self.rng
+
+    def enable_profiling(self, enabled=True):
+        # per-phase timers of step/reset: see self.profiler.snapshot()
+        self.profiler = Profiler() if enabled else NULL_PROFILER
+        self.map.profiler = self.profiler
+
+    def step(self, action, out=None):
+        prof = self.profiler
+        prof.start('step')
+        if self.graph.graph_index < 0:  # -1 until the first reset
             raise RuntimeError('Error: Environment has never been reset()')
         sub_id = -1
         if self.game_over or self.time_over:
             raise ValueError(
                 'Environment has already been terminated. need to be reset!')
-        oid = self.map.act(action)
-        if (action, oid) in self.config.subtask_param_to_id:  # if (action, item) is one of the subtasks
-            sid = self.config.subtask_param_to_id[(action, oid)]
-
-            if sid in self.subtask_id_list:  # if sub_id is in the subtask graph
+        code = action_code(action)
+        oid = self.map.act(code)
+        if oid >= 0:  # (action, item) -> subtask id (-1: not a subtask)
+            sid = int(self.map.tables.subtask_table[code, oid])
+            if sid >= 0 and self.id_to_ind[sid] >= 0:  # if sub_id is in the subtask graph
                 sub_id = sid
-            else:
-                #print('Warning! Executed a non-existing subtask')
-                pass
+        prof.tick('subtask_lookup')
         #
         self.reward = self._act_subtask(sub_id)
         self.ret += self.reward*self.gamma
         self.step_count += 1
         self.time_over = self.step_count >= self.game_length
-        self.game_over = (self.eligibility*self.mask).sum().item() == 0
+        prof.tick('act_subtask')
+        # eligibility only changes when the completion changes
+        if self.executed_sub_ind >= 0:
+            self._compute_elig(self.executed_sub_ind)
+        if sub_id >= 0:  # mask or eligibility has changed
+            self.game_over = not np.logical_and(self.eligibility, self.mask).any()
         if self.rendering:
             self.render()
+            prof.tick('render')
 
-        return self._get_state(), self.reward, (self.game_over or self.time_over), self._get_info()
+        state = self._get_state(out)
+        prof.tick('get_state')
+        return state, self.reward, (self.game_over or self.time_over), self._get_info()
 
-    def reset(self, seed=None, graph_index=None):  # after every episode
+    def reset(self, seed=None, graph_index=None, out=None):  # after every episode
+        prof = self.profiler
+        prof.start('reset')
         if seed is not None:
-            np.random.seed(seed)
+            self.seed(seed)
         if graph_index is None:
-            graph_index = np.random.permutation(self.graph.num_graph)[0]
+            graph_index = self.rng.integers(self.graph.num_graph)
         else:
             graph_index = graph_index % self.graph.num_graph
 
         # 1. reset graph
         if graph_index >= 0:
-            self.graph.set_graph_index(graph_index)
-            self.nb_subtask = len(self.graph.subtask_id_list)
-            self.rew_mag = self.graph.rew_mag
-            self.subtask_id_list = self.graph.subtask_id_list
+            self._set_graph(graph_index)
+        prof.tick('graph')
 
         # 2. reset subtask status
         self.executed_sub_ind = -1
@@ -92,6 +144,8 @@ class MazeEnv(object):  # single batch
             self.mask_id[sub_id] = 1
         self.completion, self.comp_id = np.zeros(
             self.nb_subtask, dtype=np.int8), np.zeros(self.max_task, dtype=np.uint8)
+        self.elig_id = np.zeros(self.max_task, dtype=np.int8)
+        prof.tick('subtask_status')
         self._compute_elig()
         self.step_count, self.ret, self.reward = 0, 0, 0
 
@@ -99,11 +153,16 @@ class MazeEnv(object):  # single batch
         self.map.reset(self.subtask_id_list)
         if self.rendering:
             self.render()
-        return self._get_state(), self._get_info()
+            prof.tick('render')
+
+        state = self._get_state(out)
+        prof.tick('get_state')
+        return state, self._get_info()
 
     def state_spec(self):
         return [
-            {'dtype': self.map.get_obs().dtype, 'name': 'observation', 'shape': self.map.get_obs().shape},
+            {'dtype': dtype, 'name': name, 'shape': shape}
+            for name, dtype, shape in self.obs_encoder.spec()] + [
             {'dtype': self.mask_id.dtype, 'name': 'mask', 'shape': self.mask_id.shape},
             {'dtype': self.comp_id.dtype, 'name': 'completion', 'shape': self.comp_id.shape},
             {'dtype': self.elig_id.dtype, 'name': 'eligibility', 'shape': self.elig_id.shape},
@@ -112,8 +171,85 @@ class MazeEnv(object):  # single batch
 
     def get_actions(self):
         return self.config.legal_actions
+
+    def new_state_buffer(self, dtype=np.float64):
+        # preallocated state to be filled by step/reset/get_state(out=...)
+        state = {name: np.zeros(shape, dtype=obs_dtype)
+                 for name, obs_dtype, shape in self.obs_encoder.spec()}
+        state.update({
+            'mask': np.zeros(self.max_task, dtype=dtype),
+            'completion': np.zeros(self.max_task, dtype=dtype),
+            'eligibility': np.zeros(self.max_task, dtype=dtype),
+            'step': 0
+        })
+        return state
+
+    def get_state(self, out=None, copy=True):
+        # copy: return new arrays instead of the live map tensor/state buffer
+        if out is None and copy:
+            dtype = np.float64 if self.state_buffer is None \
+                else self.state_buffer['mask'].dtype
+            out = self.new_state_buffer(dtype)
+        return self._get_state(out)
     
-    def render(self):
+    def new_state_snapshot(self, shape=()):
+        # zero snapshot record(s), e.g. one per node of a search tree
+        return np.zeros(shape, dtype=self.snapshot_dtype)
+
+    def get_state_snapshot(self, out=None):
+        # copy of the mutable state (map, subtask status, counters, rng)
+        if self.graph.graph_index < 0:  # -1 until the first reset
+            raise RuntimeError('Error: Environment has never been reset()')
+        if out is None:
+            out = self.new_state_snapshot()
+        n = self.nb_subtask
+        self.map.get_state_snapshot(out)
+        out['graph_index'] = self.graph.graph_index
+        out['game_length'] = self.game_length
+        out['step_count'] = self.step_count
+        out['ret'], out['reward'] = self.ret, self.reward
+        out['game_over'], out['time_over'] = self.game_over, self.time_over
+        out['executed_sub_ind'] = self.executed_sub_ind
+        out['mask'][:n] = self.mask
+        out['completion'][:n] = self.completion
+        out['eligibility'][:n] = self.eligibility
+        out['mask_id'][...] = self.mask_id
+        out['comp_id'][...] = self.comp_id
+        out['elig_id'][...] = self.elig_id
+        out['rng'][...] = _pack_rng_state(self.rng)
+        return out
+
+    def restore_state_snapshot(self, snapshot):
+        # the graph data is shared, only reloaded if the graph differs
+        graph_index = int(snapshot['graph_index'])
+        if graph_index != self.graph.graph_index:
+            self._set_graph(graph_index)
+            self.map.subtask_id_list = self.subtask_id_list
+            self.map.nb_subtask = self.nb_subtask
+        n = self.nb_subtask
+        self.map.restore_state_snapshot(snapshot)
+        self.game_length = int(snapshot['game_length'])
+        self.step_count = int(snapshot['step_count'])
+        self.ret, self.reward = float(snapshot['ret']), float(snapshot['reward'])
+        self.game_over = bool(snapshot['game_over'])
+        self.time_over = bool(snapshot['time_over'])
+        self.executed_sub_ind = int(snapshot['executed_sub_ind'])
+        self.mask = snapshot['mask'][:n].copy()
+        self.completion = snapshot['completion'][:n].copy()
+        self.mask_id = snapshot['mask_id'].copy()
+        self.comp_id = snapshot['comp_id'].copy()
+        self.elig_id = snapshot['elig_id'].copy()
+        if self.graph.engine is not None:  # rebuild the incremental state
+            self.eligibility = self.graph.reset_elig(self.completion)
+        else:
+            self.eligibility = snapshot['eligibility'][:n].copy()
+        _unpack_rng_state(self.rng, snapshot['rng'])
+
+    def render(self, mode='human', tile_size=None, out=None):
+        if mode == 'rgb_array':
+            return self.map.render_rgb(tile_size, out)
+        elif mode != 'human':
+            raise ValueError("Unsupported render mode: {}".format(mode))
         GREEN = "#50a000"
         DARK_RED = "#a30000"
         LIGHT = "#c0c0c0"  # light gray
@@ -127,22 +263,43 @@ class MazeEnv(object):  # single batch
                 color.append(LIGHT)
             else:  # elig
                 color.append('white')
-        self.graph.draw_graph(self.config, self.rew_mag, color)
+        graph_rgb = self.graph.draw_graph(self.config, self.rew_mag, color)
         text_lines, text_widths, status, bg_colors = self._get_status()
         self.map.render(self.step_count, text_lines,
-                        text_widths, status, bg_colors)
+                        text_widths, status, bg_colors, graph_rgb)
 
     # internal
-    def _get_state(self):
+    def _get_state(self, out=None):
         step = self.game_length - self.step_count
-        return {
-            'observation': self.map.get_obs(),
-            'mask': self.mask_id.astype(np.float),
-            'completion': self.comp_id.astype(np.float),
-            'eligibility': self.elig_id.astype(np.float),
-            'step': step
-        }
+        if out is None:
+            out = self.state_buffer
+        maze = self.map
+        if out is None:
+            state = self.obs_encoder.encode(
+                maze.obs, maze.item_map, maze.agent_x, maze.agent_y)
+            state.update({
+                'mask': self.mask_id.astype(np.float64),
+                'completion': self.comp_id.astype(np.float64),
+                'eligibility': self.elig_id.astype(np.float64),
+                'step': step
+            })
+            return state
+        self.obs_encoder.encode(
+            maze.obs, maze.item_map, maze.agent_x, maze.agent_y, out)
+        out['mask'][...] = self.mask_id
+        out['completion'][...] = self.comp_id
+        out['eligibility'][...] = self.elig_id
+        out['step'] = step
+        return out
     
+    def _set_graph(self, graph_index):
+        self.graph.set_graph_index(graph_index)
+        self.nb_subtask = len(self.graph.subtask_id_list)
+        self.rew_mag = self.graph.rew_mag
+        self.subtask_id_list = self.graph.subtask_id_list
+        self.id_to_ind = np.full(self.max_task, -1, dtype=np.int64)
+        self.id_to_ind[self.graph.ind_to_id_array] = np.arange(self.nb_subtask)
+
     def _get_info(self):
         return {
             'graph': self.graph
@@ -153,23 +310,34 @@ class MazeEnv(object):  # single batch
         reward = self.step_reward
         if sub_id < 0:
             return reward
-        sub_ind = self.graph.id_to_ind[sub_id]
+        sub_ind = int(self.id_to_ind[sub_id])
+        self.profiler.count('subtask_attempts')
         if self.eligibility[sub_ind] == 1 and self.mask[sub_ind] == 1:
             self.completion[sub_ind] = 1
             self.comp_id[sub_id] = 1
             reward += self.rew_mag[sub_ind]
             self.executed_sub_ind = sub_ind
+            self.profiler.count('subtask_completions')
         self.mask[sub_ind] = 0
         self.mask_id[sub_id] = 0
 
-        self._compute_elig()
-
         return reward
 
-    def _compute_elig(self):
-        self.eligibility = self.graph.get_elig(self.completion)
-        self.elig_id = get_id_from_ind_multihot(
-            self.eligibility, self.graph.ind_to_id, self.max_task)
+    def _compute_elig(self, sub_ind=None):
+        if sub_ind is None:
+            self.eligibility = self.graph.reset_elig(self.completion)
+            changed = None
+        else:
+            self.eligibility, changed = self.graph.update_elig(
+                self.completion, sub_ind)
+        self.profiler.tick('get_elig')
+        if changed is None:
+            self.elig_id.fill(0)
+            self.elig_id[self.graph.ind_to_id_array] = self.eligibility
+        else:
+            for ind in changed:
+                self.elig_id[self.graph.ind_to_id[ind]] = self.eligibility[ind]
+        self.profiler.tick('get_id')
 
     # rendering
     def _get_status(self, reward=None):
@@ -208,3 +376,22 @@ class MazeEnv(object):  # single batch
         status = fmt.format(
             self.step_count, self.game_length, self.ret, self.reward)
         return text_lines, text_widths, status, bg_colors
+
+
+def _pack_rng_state(rng):
+    # PCG64 state of a Generator as uint64 (state, inc: 128 bits each)
+    state = rng.bit_generator.state
+    if state['bit_generator'] != 'PCG64':
+        raise ValueError('Unsupported bit generator: ' + state['bit_generator'])
+    mask = (1 << 64) - 1
+    st, inc = state['state']['state'], state['state']['inc']
+    return [st >> 64, st & mask, inc >> 64, inc & mask,
+            state['has_uint32'], state['uinteger']]
+
+
+def _unpack_rng_state(rng, packed):
+    st_hi, st_lo, inc_hi, inc_lo, has_uint32, uinteger = [int(v) for v in packed]
+    rng.bit_generator.state = {
+        'bit_generator': 'PCG64',
+        'state': {'state': (st_hi << 64) | st_lo, 'inc': (inc_hi << 64) | inc_lo},
+        'has_uint32': has_uint32, 'uinteger': uinteger}
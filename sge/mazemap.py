@@ -1,14 +1,9 @@
-try:
-    import pygame
-    import pygame.freetype
-except ImportError:
-    pygame = None
-
 import os
+import importlib
 import numpy as np
-import matplotlib.pyplot as plt
-from collections import deque
-from sge.utils import MOVE_ACTS, AGENT, BLOCK, WATER, KEY, OBJ_BIAS,\
+from sge.profiler import NULL_PROFILER
+from sge.gametables import GameTables, action_code
+from sge.utils import AGENT, BLOCK, WATER, OBJ_BIAS,\
     TYPE_PICKUP, TYPE_TRANSFORM, \
     WHITE, BLACK, DARK, LIGHT, GREEN, DARK_RED
 
@@ -16,10 +11,25 @@ CHR_WIDTH = 9
 TABLE_ICON_SIZE = 40
 MARGIN = 10
 LEGEND_WIDTH = 250
+RAND_BUFFER = 1024  # uniform numbers drawn at once for the moving objects
+NEIGHBORS = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])  # moves of the objects
+
+pygame = None  # imported when rendering is enabled (see _import_pygame)
 
 __PATH__ = os.path.abspath(os.path.dirname(__file__))
 
 
+class MazeObject(object):
+    __slots__ = ('oid', 'pos')
+
+    def __init__(self, oid, pos):
+        self.oid = oid
+        self.pos = pos
+
+    def __getitem__(self, key):  # dict-style access, e.g. obj['pos']
+        return getattr(self, key)
+
+
 class Mazemap(object):
     def __init__(self, game_name, game_config, render_config):
         # visualization
@@ -55,12 +65,21 @@ class Mazemap(object):
             (self.config.nb_obj_type+3, self.w, self.h), dtype=np.uint8)
         self.wall_mask = np.zeros((self.w, self.h), dtype=np.bool_)
         self.item_map = np.zeros((self.w, self.h), dtype=np.int16)
-
+        # passable[x, y]: not a wall/water, obj_grid[x, y]: object at (x, y)
+        self.passable = np.ones((self.w, self.h), dtype=np.bool_)
+        self.obj_grid = np.empty((self.w, self.h), dtype=object)
+        self.objects = dict()  # insertion-ordered set of MazeObject
+        self.tables = GameTables(game_config)
+        self.speed = self.tables.speed.tolist()
+        self.profiler = NULL_PROFILER
+        self.rng = np.random.default_rng()  # set by the env (see MazeEnv.seed)
+        self.rand_buf = np.zeros(RAND_BUFFER)
+        self.rand_pos = RAND_BUFFER
+
+        self._rgb_renderers = dict()  # tile_size -> RGBRenderer
         self.init_screen_flag = False
         if self._rendering:
-            if pygame is None:
-                raise ImportError(
-                    "Rendering requires pygame installed on your environment: e.g. pip install pygame")
+            _import_pygame()
             self._init_pygame()
             self._load_game_asset()
 
@@ -70,27 +89,90 @@ class Mazemap(object):
         self.obs.fill(0)
         self.wall_mask.fill(0)
         self.item_map.fill(-1)
-        self.empty_list = []
+        self.obj_grid.fill(None)
 
         self._add_blocks()
+        self.passable = (self.item_map != BLOCK) & (self.item_map != WATER)
+        self._dist = None  # see get_distances
+        self.profiler.tick('add_blocks')
         self._add_targets()
+        self.profiler.tick('add_targets')
+        self.rand_pos = RAND_BUFFER  # drawn at the first use
+
+    @property
+    def object_list(self):
+        return list(self.objects)
+
+    # snapshots (see MazeEnv.get_state_snapshot)
+    def snapshot_fields(self):
+        # [(name, dtype, shape)] of the mutable state of the map
+        return [('obs', np.uint8, self.obs.shape),
+                ('item_map', np.int16, (self.w, self.h)),
+                ('passable', np.bool_, (self.w, self.h)),
+                ('agent', np.int64, (2,)),
+                ('agent_init', np.int64, (2,)),
+                ('omask', np.int8, (self.config.nb_obj_type,)),
+                ('objects', np.int16, (self.tables.max_obj, 3)),  # oid, x, y
+                ('nb_obj', np.int64),
+                ('rand_buf', np.float64, (RAND_BUFFER,)),
+                ('rand_pos', np.int64)]
+
+    def get_state_snapshot(self, out):
+        # writes the state into the record out (see snapshot_fields)
+        out['obs'][...] = self.obs
+        out['item_map'][...] = self.item_map
+        out['passable'][...] = self.passable
+        out['agent'][...] = (self.agent_x, self.agent_y)
+        out['agent_init'][...] = (self.agent_init_pos_x, self.agent_init_pos_y)
+        out['omask'][...] = self.omask
+        out['nb_obj'] = len(self.objects)
+        if len(self.objects) > 0:
+            out['objects'][:len(self.objects)] = [
+                (obj.oid,) + tuple(obj.pos) for obj in self.objects]
+        out['rand_buf'][...] = self.rand_buf
+        out['rand_pos'] = self.rand_pos
+
+    def restore_state_snapshot(self, snapshot):
+        layout = slice(BLOCK, WATER + 1)
+        if self.obs[layout].tobytes() != snapshot['obs'][layout].tobytes():
+            self._restore_layout(snapshot)  # other episode
+        self.obs[...] = snapshot['obs']
+        self.item_map[...] = snapshot['item_map']
+        self.agent_x, self.agent_y = snapshot['agent'].tolist()
+        self.agent_init_pos_x, self.agent_init_pos_y = snapshot['agent_init'].tolist()
+        self.omask = snapshot['omask'].copy()
+        self.obj_grid.fill(None)
+        self.objects = dict()
+        self.nb_moving = 0
+        for oid, x, y in snapshot['objects'][:snapshot['nb_obj']].tolist():
+            obj = MazeObject(oid, (x, y))
+            self.obj_grid[x, y] = obj
+            self.objects[obj] = None
+            if self.speed[oid] > 0:
+                self.nb_moving += 1
+        self.rand_buf = snapshot['rand_buf'].copy()
+        self.rand_pos = int(snapshot['rand_pos'])
+
+    def _restore_layout(self, snapshot):
+        # blocks and waters are fixed during an episode (see _add_blocks)
+        item_map = snapshot['item_map']
+        self.walls = [(x, y) for x, y in zip(*(item_map == BLOCK).nonzero())]
+        self.waters = [(x, y) for x, y in zip(*(item_map == WATER).nonzero())]
+        self.passable = snapshot['passable'].copy()
+        self.empty_list = [(x, y) for x, y in zip(*self.passable.nonzero())]
+        self._dist = None
 
     def act(self, action):
+        # action: KEY or integer action code (see gametables.ACTION_CODE)
         oid = -1
-        assert action in self.legal_actions, 'Illegal action: '
-        if action in {KEY.UP, KEY.DOWN, KEY.LEFT, KEY.RIGHT}:  # move
-            new_x = self.agent_x
-            new_y = self.agent_y
-            if action == KEY.RIGHT:
-                new_x += 1
-            elif action == KEY.LEFT:
-                new_x -= 1
-            elif action == KEY.DOWN:
-                new_y += 1
-            elif action == KEY.UP:
-                new_y -= 1
+        code = action_code(action)
+        tables = self.tables
+        assert tables.is_legal(code), 'Illegal action: {}'.format(action)
+        if tables.move_code[code]:  # move
+            new_x = self.agent_x + int(tables.dx[code])
+            new_y = self.agent_y + int(tables.dy[code])
             # wall_collision
-            if not (new_x, new_y) in self.walls and not (new_x, new_y) in self.waters:
+            if self.passable[new_x, new_y]:
                 self.obs[AGENT, self.agent_x, self.agent_y] = 0
                 self.agent_x = new_x
                 self.agent_y = new_y
@@ -99,144 +181,214 @@ class Mazemap(object):
             iid = self._get_cur_item()
             if iid > -1:
                 oid = iid-3
-                self._perform(action, oid)  # perform action in the map
+                self._perform(code, oid)  # perform action in the map
+        self.profiler.tick('act')
         self._process_obj()  # moving objects
+        self.profiler.tick('process_obj')
         return oid
 
     def get_obs(self):
         return self.obs
 
+    def get_distances(self):
+        # (w*h, w*h) int16 shortest path lengths between cells (index x*h+y),
+        # -1 if unreachable or not passable. Objects do not block the agent,
+        # so this only changes at reset, and is computed on the first call.
+        if self._dist is None:
+            self._dist = self._compute_distances()
+        return self._dist
+
+    def distance_map(self, x=None, y=None):
+        # (w, h) distances from (x, y) (default: agent position)
+        if x is None:
+            x, y = self.agent_x, self.agent_y
+        return self.get_distances()[x*self.h + y].reshape(self.w, self.h)
+
+    def object_distances(self):
+        # distance from the agent to each object of self.object_list
+        dist = self.distance_map()
+        return np.array([dist[obj.pos] for obj in self.objects], dtype=np.int16)
+
+    def nearest_object_distances(self):
+        # (nb_obj_type,) distance from the agent to the nearest object of
+        # each type, -1 if there is none
+        dist = self.distance_map().ravel()
+        item = self.item_map.ravel()
+        nb_obj_type = self.config.nb_obj_type
+        out = np.full(nb_obj_type, np.iinfo(np.int16).max, dtype=np.int16)
+        cells = (item >= OBJ_BIAS) & (dist >= 0)
+        np.minimum.at(out, item[cells] - OBJ_BIAS, dist[cells])
+        out[out == np.iinfo(np.int16).max] = -1
+        return out
+
+    def get_rgb_renderer(self, tile_size=None):
+        # sprite atlases are built once per tile size
+        if tile_size is None:
+            tile_size = self.render_scale
+        if tile_size not in self._rgb_renderers:
+            from sge.rgbrender import RGBRenderer
+            self._rgb_renderers[tile_size] = RGBRenderer(
+                self.gamename, self.config, tile_size)
+        return self._rgb_renderers[tile_size]
+
+    def render_rgb(self, tile_size=None, out=None):
+        # (h*tile_size, w*tile_size, 3) uint8 image of the map, no pygame
+        return self.get_rgb_renderer(tile_size).render(
+            self.item_map, self.agent_x, self.agent_y, out)
+
     def _process_obj(self):
-        for obj in self.object_list:
-            oid = obj['oid']
-            obj_param = self.config.object_param_list[oid]
-            if 'speed' in obj_param and obj_param['speed'] > 0 and np.random.uniform() < obj_param['speed']:
-                # randomly move
-                x, y = obj['pos']
-                candidates = [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]
-                pool = []
-                for nx, ny in candidates:
-                    if self.item_map[nx, ny] == -1:
-                        pool.append((nx, ny))
+        if self.nb_moving == 0:
+            return
+        # The objects move one by one in list order, each one seeing the
+        # earlier moves: the i-th object moves if u[i] < speed, to the
+        # int(u[n+i]*k)-th of its k empty neighbors (in NEIGHBORS order).
+        order = list(self.objects)
+        n = len(order)
+        u = self._random(2 * n).tolist()
+        speed, item_map = self.speed, self.item_map
+        for i, obj in enumerate(order):
+            if u[i] < speed[obj.oid]:
+                x, y = obj.pos
+                pool = [(nx, ny) for nx, ny in
+                        [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]
+                        if item_map[nx, ny] == -1]
                 if len(pool) > 0:
-                    new_pos = tuple(np.random.permutation(pool)[0])
-                    # remove and push
-                    self._remove_item(obj)
-                    self._add_item(oid, new_pos)
+                    self._move_item(obj, pool[int(u[n+i] * len(pool))])
+
+    def _random(self, n):
+        # next n numbers of the buffer, refilled by RAND_BUFFER draws
+        if self.rand_pos + n > RAND_BUFFER:
+            self.rand_buf = self.rng.random(RAND_BUFFER)
+            self.rand_pos = 0
+        u = self.rand_buf[self.rand_pos:self.rand_pos+n]
+        self.rand_pos += n
+        return u
 
     def _remove_item(self, obj):
-        oid = obj['oid']
-        x, y = obj['pos']
+        oid = obj.oid
+        x, y = obj.pos
         self.obs[oid+OBJ_BIAS, x, y] = 0
         self.item_map[x, y] = -1
-        self.object_list.remove(obj)
+        self.obj_grid[x, y] = None
+        del self.objects[obj]
+        if self.speed[oid] > 0:
+            self.nb_moving -= 1
 
     def _add_item(self, oid, pos):
-        obj = dict(oid=oid, pos=pos)
+        obj = MazeObject(oid, pos)
         self.obs[oid+OBJ_BIAS, pos[0], pos[1]] = 1
         self.item_map[pos[0], pos[1]] = oid+OBJ_BIAS
-        self.object_list.append(obj)
-
-    def _perform(self, action, oid):
-        assert(action not in MOVE_ACTS)
-        act_type = self.operation_list[action]['oper_type']
-        obj = None
-        for oind in range(len(self.object_list)):
-            o = self.object_list[oind]
-            if o['pos'] == (self.agent_x, self.agent_y):
-                obj = o
-                break
+        self.obj_grid[pos[0], pos[1]] = obj
+        self.objects[obj] = None
+        if self.speed[oid] > 0:
+            self.nb_moving += 1
+        return obj
+
+    def _move_item(self, obj, pos):
+        # moves obj to the empty cell pos (keeps its place in the list)
+        iid = obj.oid + OBJ_BIAS
+        x, y = obj.pos
+        self.obs[iid, x, y] = 0
+        self.item_map[x, y] = -1
+        self.obj_grid[x, y] = None
+        obj.pos = pos
+        self.obs[iid, pos[0], pos[1]] = 1
+        self.item_map[pos[0], pos[1]] = iid
+        self.obj_grid[pos[0], pos[1]] = obj
+
+    def _perform(self, code, oid):
+        tables = self.tables
+        assert not tables.move_code[code]
+        act_type = tables.oper_type[code]
+        obj = self.obj_grid[self.agent_x, self.agent_y]
         assert obj is not None
 
         # pickup
-        if act_type == TYPE_PICKUP and self.config.object_param_list[oid]['pickable']:
+        if act_type == TYPE_PICKUP and tables.pickable[oid]:
             self._remove_item(obj)
         # transform
-        elif act_type == TYPE_TRANSFORM and self.config.object_param_list[oid]['transformable']:
+        elif act_type == TYPE_TRANSFORM and tables.transformable[oid]:
             self._remove_item(obj)
-            outcome_oid = self.config.object_param_list[oid]['outcome']
+            outcome_oid = int(tables.outcome[oid])
             self._add_item(outcome_oid, (self.agent_x, self.agent_y))
 
     def _add_blocks(self):
         # boundary
-        self.walls = [(0, y) for y in range(self.h)]  # left wall
-        self.walls = self.walls + [(self.w-1, y)
-                                   for y in range(self.h)]  # right wall
-        self.walls = self.walls + [(x, 0)
-                                   for x in range(self.w)]  # bottom wall
-        self.walls = self.walls + [(x, self.h-1)
-                                   for x in range(self.w)]  # top wall
-
-        for x in range(self.w):
-            for y in range(self.h):
-                if (x, y) not in self.walls:
-                    self.empty_list.append((x, y))
-                else:
-                    self.item_map[x, y] = 1  # block
+        free = np.ones((self.w, self.h), dtype=np.bool_)
+        free[[0, -1], :] = False
+        free[:, [0, -1]] = False
+        self.walls = [(x, y) for x, y in zip(*(~free).nonzero())]
 
         # random block
         if self.config.nb_block[0] < self.config.nb_block[1]:
-            nb_block = np.random.randint(
+            nb_block = self.rng.integers(
                 self.config.nb_block[0], self.config.nb_block[1])
-            pool = np.random.permutation(self.empty_list)
-            count = 0
-            for (x, y) in pool:
-                if count == nb_block:
-                    break
-                # based on self.item_map & empty_list
-                if self._check_block(self.empty_list):
-                    self.empty_list.remove((x, y))
-                    self.walls.append((x, y))
-                    self.item_map[x, y] = 1  # block
-                    count += 1
-            if count != nb_block:
-                print(
-                    'cannot generate a map without inaccessible regions! Decrease the #blocks')
-                assert(False)
+            self.walls += self._sample_blocks(free, nb_block)
         for (x, y) in self.walls:
+            self.item_map[x, y] = 1  # block
             self.obs[BLOCK, x, y] = 1
 
         # random water
         self.waters = []
         if self.config.nb_water[0] < self.config.nb_water[1]:
-            nb_water = np.random.randint(
+            nb_water = self.rng.integers(
                 self.config.nb_water[0], self.config.nb_water[1])
-            pool = np.random.permutation(self.empty_list)
-            count = 0
+            self.waters = self._sample_blocks(free, nb_water)
+        for (x, y) in self.waters:
+            self.item_map[x, y] = 2  # water
+            self.obs[WATER, x, y] = 1
+        self.empty_list = [(x, y) for x, y in zip(*free.nonzero())]
+
+    def _sample_blocks(self, free, nb_block):
+        # Take the cells in random order, skipping the ones that would
+        # disconnect the free cells. Skipped cells are retried in later
+        # passes, and a pass without any placement fails.
+        cells = np.transpose(free.nonzero())
+        pool = [tuple(cell) for cell in cells[self.rng.permutation(len(cells))]]
+        blocks = []
+        nb_pass = 0
+        while len(blocks) < nb_block:
+            if nb_pass > 0:
+                self.profiler.count('map_block_retries')
+            nb_pass += 1
+            skipped = []
             for (x, y) in pool:
-                if count == nb_water:
+                if len(blocks) == nb_block:
                     break
-                if self._check_block(self.empty_list):  # success
-                    self.empty_list.remove((x, y))
-                    self.waters.append((x, y))
-                    # water
-                    self.item_map[x, y] = 2
-                    self.obs[WATER, x, y] = 1
-                    count += 1
-            if count != nb_water:
-                raise RuntimeError('Cannot generate a map without\
-                    inaccessible regions! Decrease the #waters or #blocks')
+                if self._check_block(free, x, y):
+                    free[x, y] = False
+                    blocks.append((x, y))
+                else:
+                    skipped.append((x, y))
+            if len(skipped) == len(pool):
+                self.profiler.count('map_generation_failures')
+                raise RuntimeError('Cannot generate a map without inaccessible '
+                                   'regions! Decrease the #waters or #blocks')
+            pool = skipped
+        return blocks
 
     def _add_targets(self):
         # reset
-        self.object_list = []
+        self.objects = dict()
+        self.nb_moving = 0
         self.omask = np.zeros((self.config.nb_obj_type), dtype=np.int8)
 
         # create objects
         # 1. create required objects
-        pool = np.random.permutation(self.empty_list)
+        pool = self.rng.permutation(self.empty_list)
         for tind in range(self.nb_subtask):
             # make sure each subtask is executable
             self._place_object(tind, (pool[tind][0], pool[tind][1]))
         # 2. create additional objects
         index = self.nb_subtask
-        for obj_param in self.config.object_param_list:
-            if 'max' in obj_param:
-                oid = obj_param['oid']
-                nb_obj = np.random.randint(0, obj_param['max']+1)
-                for i in range(nb_obj):
-                    self._add_item(oid, (pool[index][0], pool[index][1]))
-                    index += 1
+        extra = [obj_param for obj_param in self.config.object_param_list
+                 if 'max' in obj_param]
+        nb_objs = self.rng.integers(0, [obj_param['max']+1 for obj_param in extra])
+        for obj_param, nb_obj in zip(extra, nb_objs):
+            oid = obj_param['oid']
+            for i in range(nb_obj):
+                self._add_item(oid, (pool[index][0], pool[index][1]))
+                index += 1
 
         # create agent
         (self.agent_init_pos_x, self.agent_init_pos_y) = pool[index]
@@ -254,23 +406,69 @@ class Mazemap(object):
             self.omask[oid] = 1
             self._add_item(oid, pos)
 
-    def _check_block(self, empty_list):
-        nb_empty = len(empty_list)
-        mask = np.copy(self.item_map)
-        #
-        queue = deque([empty_list[0]])
-        x, y = empty_list[0]
-        mask[x, y] = 1
-        count = 0
-        while len(queue) > 0:
-            [x, y] = queue.popleft()
-            count += 1
-            candidate = [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]
-            for item in candidate:
-                if mask[item[0], item[1]] == -1:  # if empty
-                    mask[item[0], item[1]] = 1
-                    queue.append(item)
-        return count == nb_empty
+    def _check_block(self, free, x, y):
+        # True if the free cells stay connected without (x, y)
+        ring = [(x+1, y), (x+1, y+1), (x, y+1), (x-1, y+1),
+                (x-1, y), (x-1, y-1), (x, y-1), (x+1, y-1)]
+        occ = [int(free[pos]) for pos in ring]
+        nb_adj = occ[0] + occ[2] + occ[4] + occ[6]
+        if nb_adj <= 1:  # dead end (or the last free cell)
+            return nb_adj == 1
+        # adjacent cells joined through a free diagonal cell are still
+        # connected locally, so a single local group is always safe
+        nb_joined = sum(occ[i] and occ[i+1] and occ[(i+2) % 8]
+                        for i in range(0, 8, 2))
+        if max(nb_adj - nb_joined, 1) == 1:
+            return True
+        self.profiler.count('map_connectivity_checks')
+        free[x, y] = False
+        connected = self._is_connected(free)
+        free[x, y] = True
+        return connected
+
+    def _is_connected(self, free):
+        # flood fill from a free cell by 4-neighbor dilation
+        reached = np.zeros_like(free)
+        reached[tuple(np.transpose(free.nonzero())[0])] = True
+        count = 1
+        while True:
+            grown = reached.copy()
+            grown[1:] |= reached[:-1]
+            grown[:-1] |= reached[1:]
+            grown[:, 1:] |= reached[:, :-1]
+            grown[:, :-1] |= reached[:, 1:]
+            grown &= free
+            new_count = grown.sum()
+            if new_count == count:
+                return count == free.sum()
+            reached, count = grown, new_count
+
+    def _compute_distances(self):
+        # BFS from every passable cell at once: reach = reach x adj (with
+        # self loops) over the passable cells, d counts the unreached steps
+        w, h = self.w, self.h
+        cells = self.passable.ravel().nonzero()[0]
+        P = len(cells)
+        index = np.full(w*h, -1)
+        index[cells] = np.arange(P)
+        adj = np.eye(P, dtype=np.float32)
+        for offset in (1, -1, h, -h):  # the boundary is always a wall
+            nb = index[cells+offset]
+            adj[(nb >= 0).nonzero()[0], nb[nb >= 0]] = 1
+        reach = np.eye(P, dtype=np.float32)
+        d = np.zeros((P, P), dtype=np.int16)
+        nb_reached = P
+        while True:
+            d += reach == 0
+            reach = np.minimum(np.dot(reach, adj), 1)
+            count = np.count_nonzero(reach)
+            if count == nb_reached:
+                break
+            nb_reached = count
+        d[reach == 0] = -1
+        dist = np.full((w*h, w*h), -1, dtype=np.int16)
+        dist[cells[:, None], cells] = d
+        return dist
 
     def _get_cur_item(self):
         return self.item_map[self.agent_x, self.agent_y]
@@ -304,10 +502,11 @@ class Mazemap(object):
         object_param_list = self.config.object_param_list
         self.object_image_list, self.obj_img_plt_list = [], []
         img_folder = os.path.join(ROOT_DIR, 'asset', self.gamename, 'Icon')
+        from matplotlib.image import imread
         for obj in object_param_list:
             image = pygame.image.load(os.path.join(img_folder, obj['imgname']))
             self.object_image_list.append(image)
-            image = plt.imread(os.path.join(img_folder, obj['imgname']))
+            image = imread(os.path.join(img_folder, obj['imgname']))
             self.obj_img_plt_list.append(image)
         self.agent_img = pygame.image.load(
             os.path.join(img_folder, 'agent.png'))
@@ -320,15 +519,16 @@ class Mazemap(object):
             self.block_img = pygame.image.load(
                 os.path.join(img_folder, 'block.png'))
 
-    def render(self, step_count, text_lines, text_widths, status, bg_colors):
+    def render(self, step_count, text_lines, text_widths, status, bg_colors,
+               graph_rgb):
+        # graph_rgb: (H, W, 3) uint8 image of the subtask graph
         if not self._rendering:
             return
         pygame.event.pump()
         GAME_FONT = pygame.freetype.SysFont('Arial', 20)
         STAT_FONT = pygame.freetype.SysFont('Arial', 24)
         TITLE_FONT = pygame.freetype.SysFont('Arial', 30)
-        graph_img = pygame.image.load(os.path.join(
-            __PATH__, '../render/temp/subtask_graph.png'))
+        graph_img = pygame.surfarray.make_surface(graph_rgb.swapaxes(0, 1))
 
         if not self.init_screen_flag:
             self._init_screen(graph_img, text_widths, len(text_lines))
@@ -343,14 +543,13 @@ class Mazemap(object):
 
         # 1. Observation
         # items
-        for i in range(len(self.object_list)):
-            obj = self.object_list[i]
-            oid = obj['oid']
+        for obj in self.objects:
+            oid = obj.oid
             obj_img = self.object_image_list[oid]
             if obj_img.get_width() != self.render_scale:
                 obj_img = pygame.transform.scale(obj_img, size)
             self.screen.blit(
-                obj_img, (obj['pos'][0]*self.render_scale, tbias+obj['pos'][1]*self.render_scale))
+                obj_img, (obj.pos[0]*self.render_scale, tbias+obj.pos[1]*self.render_scale))
         # walls
         if self.block_img.get_width() != self.render_scale:
             self.block_img = pygame.transform.scale(self.block_img, size)
@@ -502,3 +701,17 @@ class Mazemap(object):
         else:
             raise ValueError(
                 '_rendering is False and/or environment has not been reset')
+
+
+def _import_pygame():
+    # pygame (and its fonts) is only needed by the 'human' rendering
+    global pygame
+    if pygame is None:
+        try:
+            module = importlib.import_module('pygame')
+            importlib.import_module('pygame.freetype')
+        except ImportError:
+            raise ImportError(
+                "Rendering requires pygame installed on your environment: e.g. pip install pygame")
+        pygame = module
+    return pygame
@@ -0,0 +1,82 @@
+import numpy as np
+from .utils import AGENT
+
+ENCODINGS = ['onehot', 'index', 'packed']
+
+
+class ObsEncoder(object):
+    """Encoding of the map observation, and batched decoder back to the
+    one-hot tensor of shape obs_shape (nb_plane, w, h) of Mazemap.obs.
+
+    onehot: the one-hot tensor (uint8, (nb_plane, w, h))
+    index: the item of each cell (int16, (w, h), see Mazemap.item_map: -1 if
+        empty, the plane of the item otherwise) and the agent position in
+        'agent' (int16, (2,))
+    packed: the one-hot tensor packed by np.packbits (uint8, (nb_byte,))
+    """
+    def __init__(self, encoding, obs_shape):
+        if encoding not in ENCODINGS:
+            raise ValueError('Unknown observation encoding: {}'.format(encoding))
+        self.encoding = encoding
+        self.obs_shape = tuple(obs_shape)
+        self.size = int(np.prod(self.obs_shape))
+        self._planes = np.arange(self.obs_shape[0], dtype=np.int16)[:, None, None]
+
+    def spec(self, batch_shape=()):
+        # [(name, dtype, shape)] of the encoded observation
+        if self.encoding == 'onehot':
+            entries = [('observation', np.uint8, self.obs_shape)]
+        elif self.encoding == 'index':
+            entries = [('observation', np.int16, self.obs_shape[1:]),
+                       ('agent', np.int16, (2,))]
+        else:
+            entries = [('observation', np.uint8, ((self.size + 7) // 8,))]
+        return [(name, dtype, tuple(batch_shape) + shape)
+                for name, dtype, shape in entries]
+
+    def encode(self, obs, item_map, agent_x, agent_y, out=None):
+        # dict of the encoded observation of a map, or of a batch of maps
+        # (agent_x, agent_y: (N,)). Written into out (a state dict) if given,
+        # otherwise onehot and index return the live map arrays.
+        if self.encoding == 'onehot':
+            enc = {'observation': obs}
+        elif self.encoding == 'index':
+            enc = {'observation': item_map,
+                   'agent': np.stack([agent_x, agent_y], -1).astype(np.int16)}
+        else:
+            enc = {'observation': np.packbits(
+                obs.reshape(obs.shape[:-3] + (-1,)), axis=-1)}
+        if out is None:
+            return enc
+        for name, value in enc.items():
+            out[name][...] = value
+        return out
+
+    def decode(self, observation, agent=None, out=None):
+        # (..., encoded shape) -> (..., nb_plane, w, h) uint8 one-hot tensors
+        observation = np.asarray(observation)
+        if self.encoding == 'onehot':
+            if out is None:
+                return observation
+            out[...] = observation
+            return out
+        if self.encoding == 'index':
+            return self._decode_index(observation, np.asarray(agent), out)
+        batch_shape = observation.shape[:-1]
+        bits = np.unpackbits(observation, axis=-1, count=self.size)
+        bits = bits.reshape(batch_shape + self.obs_shape)
+        if out is None:
+            return bits
+        out[...] = bits
+        return out
+
+    def _decode_index(self, index_map, agent, out):
+        batch_shape = index_map.shape[:-2]
+        if out is None:
+            out = np.empty(batch_shape + self.obs_shape, dtype=np.uint8)
+        # plane c is 1 where the item is c (no item is the agent)
+        np.equal(index_map[..., None, :, :], self._planes, out=out.view(np.bool_))
+        flat = out.reshape((-1,) + self.obs_shape)
+        agent = agent.reshape(-1, 2)
+        flat[np.arange(len(agent)), AGENT, agent[:, 0], agent[:, 1]] = 1
+        return out
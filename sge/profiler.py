@@ -0,0 +1,71 @@
+import time
+
+
+class Profiler(object):
+    """Cumulative wall time and number of calls of the phases of a section
+    (e.g. 'step', 'reset'), and named event counters.
+
+    start(section) opens a section, and each tick(phase) charges the time
+    elapsed since the previous start/tick to that phase.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sections = dict()
+        self.counters = dict()
+        self._section = None
+        self._last = time.perf_counter()
+
+    def start(self, section):
+        if section not in self.sections:
+            self.sections[section] = dict(calls=0, phases=dict())
+        sec = self.sections[section]
+        sec['calls'] += 1
+        self._section = sec['phases']
+        self._last = time.perf_counter()
+
+    def tick(self, phase):
+        now = time.perf_counter()
+        phases = self._section
+        if phase in phases:
+            stat = phases[phase]
+            stat[0] += now - self._last
+            stat[1] += 1
+        else:
+            phases[phase] = [now - self._last, 1]
+        self._last = now
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self, reset=False):
+        out = dict(counters=dict(self.counters))
+        for section, sec in self.sections.items():
+            out[section] = dict(calls=sec['calls'], phases={
+                phase: dict(time=stat[0], calls=stat[1])
+                for phase, stat in sec['phases'].items()})
+        if reset:
+            self.reset()
+        return out
+
+
+class NullProfiler(object):
+    """No-op profiler used when profiling is disabled."""
+    def reset(self):
+        pass
+
+    def start(self, section):
+        pass
+
+    def tick(self, phase):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def snapshot(self, reset=False):
+        return dict(counters=dict())
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,158 @@
+import os
+import struct
+import zlib
+import numpy as np
+from sge.utils import WHITE, DARK, BLOCK, WATER, OBJ_BIAS
+
+__PATH__ = os.path.abspath(os.path.dirname(__file__))
+
+WATER_COLOR = (64, 128, 255)  # water tile of the games without water icon
+
+
+class RGBRenderer(object):
+    """Renders maps to RGB arrays with NumPy only (no pygame, no display).
+
+    The icons in sge/asset/<game>/Icon are loaded once, scaled to tile_size
+    and composited on a white tile with the grid border, for each item and
+    with and without the agent on top. A frame is then a single gather of
+    these tiles indexed by item_map and the agent position.
+    """
+    def __init__(self, game_name, game_config, tile_size, grid=True):
+        self.tile_size = tile_size
+        img_folder = os.path.join(__PATH__, 'asset', game_name, 'Icon')
+        s = tile_size
+
+        # 1. item layers: tile = item_map + 1 (0: empty, 2: block, 3: water,
+        # oid+4: object), premultiplied RGBA of size (s, s)
+        self.nb_tile = game_config.nb_obj_type + OBJ_BIAS + 1
+        layers = [None] * self.nb_tile
+        block_img = 'mountain.png' if game_name == 'mining' else 'block.png'
+        layers[BLOCK+1] = _load_icon(os.path.join(img_folder, block_img), s)
+        water_img = os.path.join(img_folder, 'water.png')
+        if os.path.exists(water_img):
+            layers[WATER+1] = _load_icon(water_img, s)
+        else:
+            layers[WATER+1] = np.ones((s, s, 4))
+            layers[WATER+1][..., :3] = np.array(WATER_COLOR) / 255.
+        for obj in game_config.object_param_list:
+            layers[obj['oid']+OBJ_BIAS+1] = _load_icon(
+                os.path.join(img_folder, obj['imgname']), s)
+        agent = _load_icon(os.path.join(img_folder, 'agent.png'), s)
+
+        # 2. atlas[agent, tile]: composited tiles, uint8 (2, nb_tile, s, s, 3)
+        background = np.ones((s, s, 3)) * np.array(WHITE) / 255.
+        if grid:
+            background[[0, -1], :] = np.array(DARK) / 255.
+            background[:, [0, -1]] = np.array(DARK) / 255.
+        atlas = np.zeros((2, self.nb_tile, s, s, 3))
+        for tile, layer in enumerate(layers):
+            base = background if layer is None else _over(layer, background)
+            atlas[0, tile] = base
+            atlas[1, tile] = _over(agent, base)
+        self.atlas = np.round(atlas * 255).astype(np.uint8).reshape(
+            2 * self.nb_tile, s, s, 3)
+
+    def image_shape(self, w, h):
+        return (h * self.tile_size, w * self.tile_size, 3)
+
+    def render(self, item_map, agent_x, agent_y, out=None):
+        # item_map: (..., w, h), agent_x/agent_y: (...)
+        # returns (..., h*tile_size, w*tile_size, 3) uint8 (rows are y)
+        batch = item_map.shape[:-2]
+        w, h = item_map.shape[-2:]
+        s = self.tile_size
+        index = item_map.astype(np.intp) + 1
+        if len(batch) == 0:
+            index[agent_x, agent_y] += self.nb_tile
+        else:
+            rows = np.arange(index.shape[0])
+            index.reshape((-1, w, h))[rows, np.ravel(agent_x), np.ravel(agent_y)] \
+                += self.nb_tile
+        tiles = self.atlas[index]  # (..., w, h, s, s, 3)
+        nd = len(batch)
+        tiles = tiles.transpose(tuple(range(nd)) +
+                                (nd+1, nd+2, nd, nd+3, nd+4))
+        shape = batch + self.image_shape(w, h)
+        if out is None:
+            out = np.empty(shape, dtype=np.uint8)
+        out.reshape(batch + (h, s, w, s, 3))[...] = tiles
+        return out
+
+
+def _load_icon(fname, size):
+    # premultiplied RGBA in [0, 1], area-resampled to (size, size)
+    img = _read_png(fname) / 255.
+    if img.shape[2] == 3:
+        img = np.concatenate([img, np.ones(img.shape[:2] + (1,))], axis=2)
+    img[..., :3] *= img[..., 3:]
+    wy = _area_weights(img.shape[0], size)
+    wx = _area_weights(img.shape[1], size)
+    return np.einsum('ij,jkc,lk->ilc', wy, img, wx)
+
+
+def _read_png(fname):
+    # 8-bit RGB/RGBA non-interlaced PNG -> uint8 (h, w, 3 or 4), without
+    # any image library (the icons of sge/asset)
+    with open(fname, 'rb') as f:
+        data = f.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('Not a PNG file: {}'.format(fname))
+    pos, idat, header = 8, [], None
+    while pos < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos+8])
+        chunk = data[pos+8:pos+8+length]
+        if chunk_type == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif chunk_type == b'IDAT':
+            idat.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+        pos += 12 + length
+    w, h, depth, color_type, _, _, interlace = header
+    if depth != 8 or color_type not in (2, 6) or interlace:
+        raise ValueError('Unsupported PNG format: {}'.format(fname))
+    c = 3 if color_type == 2 else 4
+    raw = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8)
+    raw = raw.reshape(h, 1 + w*c)
+
+    # undo the filter of each row (0: none, 1: sub, 2: up, 3: average, 4: paeth)
+    img = np.zeros((h, w*c), dtype=np.uint8)
+    prev = np.zeros(w*c, dtype=np.uint8)
+    for y in range(h):
+        filter_type, line = raw[y, 0], raw[y, 1:]
+        if filter_type == 0:
+            img[y] = line
+        elif filter_type == 1:
+            img[y] = line.reshape(w, c).cumsum(0, dtype=np.uint8).ravel()
+        elif filter_type == 2:
+            img[y] = line + prev
+        else:
+            cur, up = line.tolist(), prev.tolist()
+            for i in range(w*c):
+                a = cur[i-c] if i >= c else 0
+                b = up[i]
+                if filter_type == 3:
+                    cur[i] = (cur[i] + (a + b) // 2) & 255
+                else:
+                    d = up[i-c] if i >= c else 0
+                    p = a + b - d
+                    pa, pb, pd = abs(p - a), abs(p - b), abs(p - d)
+                    pred = a if pa <= pb and pa <= pd else (b if pb <= pd else d)
+                    cur[i] = (cur[i] + pred) & 255
+            img[y] = cur
+        prev = img[y]
+    return img.reshape(h, w, c)
+
+
+def _area_weights(src, dst):
+    # (dst, src) matrix averaging the source pixels covered by each output pixel
+    lo = np.arange(dst)[:, None] * src / dst
+    hi = lo + src / dst
+    j = np.arange(src)[None, :]
+    overlap = np.clip(np.minimum(hi, j + 1) - np.maximum(lo, j), 0, None)
+    return overlap / overlap.sum(axis=1, keepdims=True)
+
+
+def _over(layer, base):
+    # premultiplied layer over an opaque RGB base
+    return layer[..., :3] + base * (1 - layer[..., 3:])
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import socket
+import struct
+import numpy as np
+from .gametables import action_code
+
+# Binary protocol: every message is a frame
+#   FRAME (payload bytes: uint32, message type: uint8) | payload
+# server -> client, once per connection: SPEC (json: observation shape, ...)
+# client -> server: RESET (seed, graph_index: int64, -1 for None),
+#                   STEP (action code: int64, -1 for KEY.QUIT), CLOSE
+# server -> client: STATE (reward: float64, done: uint8, step: int64,
+#                          graph_index: int64) | observation (uint8)
+#                   | mask | completion | eligibility (uint8 x max_task)
+#                   ERROR (utf-8 message)
+FRAME = struct.Struct('<IB')
+RESET_MSG = struct.Struct('<qq')
+STEP_MSG = struct.Struct('<q')
+STATE_MSG = struct.Struct('<dBqq')
+SPEC, RESET, STEP, CLOSE, STATE, ERROR = range(6)
+
+
+class EnvServer(object):
+    """Serves a pool of nb_env environments to concurrent clients (one env
+    per connection) over a Unix socket or TCP. The pool is a VecMazeEnv: the
+    STEP requests that arrive within batch_window seconds are executed in one
+    VecMazeEnv.step, as soon as every connected client is waiting for a step
+    or when the window ends. RESET requests are executed when received."""
+    def __init__(self, game_name, graph_param, game_len, gamma, nb_env,
+                 batch_window=0.0005, seed=None):
+        from .vecenv import VecMazeEnv
+        self.env = VecMazeEnv(game_name, graph_param, game_len, gamma, nb_env,
+                              seed=seed)
+        self.state = self.env.new_state_buffer(np.uint8)
+        self.batch_window = batch_window
+        self.spec = dict(game_name=game_name, graph_param=graph_param,
+                         observation=list(self.env.obs.shape[1:]),
+                         max_task=self.env.max_task)
+        self._free = None
+        self._server = None
+        self._nb_client = 0
+        self._pending = dict()  # env index -> (action code, future)
+        self._batch = None  # timer of the current batch window
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        # Unix socket if path is given, TCP otherwise (port 0: any free port)
+        self._free = asyncio.Queue()
+        for index in range(self.env.nb_env):
+            self._free.put_nowait(index)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    # internal
+    async def _handle(self, reader, writer):
+        index = await self._free.get()
+        self._nb_client += 1
+        try:
+            writer.write(_frame(SPEC, json.dumps(self.spec).encode('utf-8')))
+            while True:
+                head = await reader.readexactly(FRAME.size)
+                nbytes, msg_type = FRAME.unpack(head)
+                payload = await reader.readexactly(nbytes)
+                if msg_type == CLOSE:
+                    break
+                try:
+                    if msg_type == STEP:
+                        reply = await self._step(index, payload)
+                    elif msg_type == RESET:
+                        reply = self._reset(index, payload)
+                    else:
+                        raise ValueError('Unknown message type: {}'.format(msg_type))
+                except Exception as e:
+                    reply = _frame(ERROR, '{}: {}'.format(
+                        type(e).__name__, e).encode('utf-8'))
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._nb_client -= 1
+            self._free.put_nowait(index)
+            writer.close()
+            if self._pending and len(self._pending) >= self._nb_client:
+                self._run_batch()
+
+    def _reset(self, index, payload):
+        seed, graph_index = RESET_MSG.unpack(payload)
+        self.env.reset([None if seed < 0 else seed],
+                       [None if graph_index < 0 else graph_index],
+                       env_ids=[index], out=self.state)
+        return self._state_frame(index, 0.0, False)
+
+    def _step(self, index, payload):
+        # future of the STATE frame, set by the batch of the step
+        code, = STEP_MSG.unpack(payload)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[index] = (code, future)
+        if len(self._pending) >= self._nb_client:  # every client is waiting
+            self._run_batch()
+        elif self._batch is None:
+            self._batch = asyncio.get_running_loop().call_later(
+                self.batch_window, self._run_batch)
+        return future
+
+    def _run_batch(self):
+        if self._batch is not None:
+            self._batch.cancel()
+            self._batch = None
+        batch, self._pending = self._pending, dict()
+        env_ids = np.array(list(batch.keys()), dtype=np.int64)
+        codes = np.array([code for code, _ in batch.values()], dtype=np.int64)
+        try:
+            _, reward, done, _ = self.env.step(codes, self.state, env_ids)
+        except Exception:
+            # VecMazeEnv.step checks every env before stepping any: find the
+            # failing requests by stepping the envs one by one
+            for index, (code, future) in batch.items():
+                try:
+                    _, reward, done, _ = self.env.step(
+                        np.array([code]), self.state, [index])
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(
+                        self._state_frame(index, reward[index], done[index]))
+            return
+        for index, (_, future) in batch.items():
+            future.set_result(self._state_frame(index, reward[index], done[index]))
+
+    def _state_frame(self, index, reward, done):
+        state = self.state
+        return _frame(STATE, b''.join([
+            STATE_MSG.pack(reward, bool(done), state['step'][index],
+                           self.env.graph_index[index]),
+            state['observation'][index].tobytes(), state['mask'][index].tobytes(),
+            state['completion'][index].tobytes(),
+            state['eligibility'][index].tobytes()]))
+
+
+class EnvClient(object):
+    """Blocking client of EnvServer with the reset/step interface of MazeEnv.
+    The state vectors are uint8 arrays."""
+    def __init__(self, path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.spec = json.loads(self._recv(SPEC).decode('utf-8'))
+        self.obs_shape = tuple(self.spec['observation'])
+        self.max_task = self.spec['max_task']
+
+    def reset(self, seed=None, graph_index=None):
+        self.sock.sendall(_frame(RESET, RESET_MSG.pack(
+            -1 if seed is None else seed,
+            -1 if graph_index is None else graph_index)))
+        state, _, _, info = self._recv_state()
+        return state, info
+
+    def step(self, action):
+        self.sock.sendall(_frame(STEP, STEP_MSG.pack(action_code(action))))
+        return self._recv_state()
+
+    def close(self):
+        try:
+            self.sock.sendall(_frame(CLOSE, b''))
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # internal
+    def _recv_state(self):
+        payload = self._recv(STATE)
+        reward, done, step, graph_index = STATE_MSG.unpack_from(payload)
+        offset = STATE_MSG.size
+        state = dict()
+        for name, shape in [('observation', self.obs_shape),
+                            ('mask', (self.max_task,)),
+                            ('completion', (self.max_task,)),
+                            ('eligibility', (self.max_task,))]:
+            count = int(np.prod(shape))
+            state[name] = np.frombuffer(
+                payload, dtype=np.uint8, count=count, offset=offset).reshape(shape)
+            offset += count
+        state['step'] = step
+        return state, reward, bool(done), {'graph_index': graph_index}
+
+    def _recv(self, expected):
+        nbytes, msg_type = FRAME.unpack(self._recv_exactly(FRAME.size))
+        payload = self._recv_exactly(nbytes)
+        if msg_type == ERROR:
+            raise RuntimeError('Server error: ' + payload.decode('utf-8'))
+        if msg_type != expected:
+            raise RuntimeError('Unexpected message type: {}'.format(msg_type))
+        return payload
+
+    def _recv_exactly(self, nbytes):
+        buf = bytearray(nbytes)
+        view, pos = memoryview(buf), 0
+        while pos < nbytes:
+            n = self.sock.recv_into(view[pos:])
+            if n == 0:
+                raise ConnectionError('Connection closed by the server')
+            pos += n
+        return bytes(buf)
+
+
+def _frame(msg_type, payload):
+    return FRAME.pack(len(payload), msg_type) + payload
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Environment server')
+    parser.add_argument('--game_name', default='mining')
+    parser.add_argument('--graph_param', default='train_1')
+    parser.add_argument('--game_len', default=70, type=int)
+    parser.add_argument('--gamma', default=0.99, type=float)
+    parser.add_argument('--nb_env', default=64, type=int,
+                        help='number of envs (concurrent clients)')
+    parser.add_argument('--batch_window', default=0.0005, type=float,
+                        help='seconds to wait for the steps of the other clients')
+    parser.add_argument('--seed', default=None, type=int)
+    parser.add_argument('--path', default=None, help='Unix socket path')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=0, type=int)
+    args = parser.parse_args()
+
+    async def main():
+        server = EnvServer(args.game_name, args.graph_param, args.game_len,
+                           args.gamma, args.nb_env, args.batch_window, args.seed)
+        address = await server.start(args.path, args.host, args.port)
+        print('Serving on {}'.format(address), flush=True)
+        await server.serve_forever()
+    asyncio.run(main())
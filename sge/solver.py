@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import numpy as np
+from .mazeenv import load_game_config
+from .graph import SubtaskGraph
+
+
+def default_cache_dir():
+    # $SGE_CACHE_DIR, or $XDG_CACHE_HOME/sge (default: ~/.cache/sge)
+    if 'SGE_CACHE_DIR' in os.environ:
+        return os.environ['SGE_CACHE_DIR']
+    root = os.environ.get('XDG_CACHE_HOME', os.path.join('~', '.cache'))
+    return os.path.join(os.path.expanduser(root), 'sge')
+
+
+class SubtaskSolver(object):
+    """Best achievable return of the graphs of a dataset file.
+
+    An episode can complete each subtask once, when it is eligible, and
+    every completion takes at least step_cost steps, so at most
+    game_length // step_cost subtasks are completed. solve() returns the
+    maximum sum of rewards over the completion orders (the return of
+    MazeEnv is gamma times this sum) and an order achieving it. Results are
+    cached on disk per (dataset file, graph index, budget).
+    """
+    def __init__(self, game_name, graph_param, step_cost=1, cache_dir=None):
+        game_config, graph_folder, filename = load_game_config(game_name, graph_param)
+        self.graph = SubtaskGraph(graph_folder, filename, game_config.nb_subtask_type)
+        self.step_cost = step_cost
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_file = os.path.join(cache_dir, 'solver', filename + '.json')
+        self.cache = dict()
+        self._dirty = False
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file) as f:
+                self.cache = json.load(f)
+
+    def solve(self, graph_index, game_length=None):
+        # game_length=None: no step limit
+        result = self._solve(graph_index, game_length)
+        self.save()
+        return result
+
+    def solve_all(self, game_length=None):
+        # best return of every graph of the file
+        best = np.zeros(self.graph.num_graph)
+        for graph_index in range(self.graph.num_graph):
+            best[graph_index] = self._solve(graph_index, game_length)['return']
+        self.save()
+        return best
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp = self.cache_file + '.tmp{}'.format(os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_file)
+        self._dirty = False
+
+    # internal
+    def _solve(self, graph_index, game_length):
+        graph = self.graph
+        graph.set_graph_index(graph_index)
+        budget = None
+        if game_length is not None:
+            budget = game_length // self.step_cost
+            if budget >= graph.nb_subtask:
+                budget = None
+        key = '{}/{}'.format(graph_index, budget)
+        digest = _graph_digest(graph)
+        entry = self.cache.get(key)
+        if entry is None or entry['digest'] != digest:
+            ret, order = solve_graph(graph, budget)
+            entry = {'return': ret, 'order': order, 'digest': digest}
+            self.cache[key] = entry
+            self._dirty = True
+        return entry
+
+
+def solve_graph(graph, budget=None):
+    """Maximum sum of rewards and the completion order (subtask indices) for
+    the current graph of a SubtaskGraph, completing at most budget subtasks.
+
+    DP over the reachable completion bitmasks, processed by decreasing
+    number of completed subtasks. Without budget, a subtask whose reward is
+    >= 0 and that is not a NOT-parent can only enable other subtasks, so it
+    is completed as soon as it is eligible (closure), and only the other
+    subtasks are branched on.
+    """
+    n = graph.nb_subtask
+    rew = np.asarray(graph.rew_mag, dtype=np.float64)
+    bit = np.int64(1) << np.arange(n, dtype=np.int64)
+    safe = np.zeros(n, dtype=np.bool_)
+    if budget is None:
+        budget = n
+        safe = (rew >= 0) & ~(graph.ANDmat < 0).any(0)
+
+    def eligible(states):
+        comp = (states[:, None] & bit) != 0
+        tp = comp * 2. - 1
+        and_out = (tp.dot(graph.ANDmat.T) - graph.b_AND >= 0).astype(np.float64)
+        return (and_out.dot(graph.ORmat.T) - graph.b_OR >= 0) & ~comp
+
+    def closure(states, order=None):
+        # order: list extended with the completed subtasks (single state)
+        while True:
+            add = eligible(states) & safe
+            if not add.any():
+                return states
+            if order is not None:
+                order += [int(i) for i in add[0].nonzero()[0]]
+            states = states | add.dot(bit)
+
+    # 1. reachable states and transitions (src, subtask, dst)
+    start = closure(np.zeros(1, dtype=np.int64))
+    states, frontier = [start], start
+    src, act, dst = [], [], []
+    while len(frontier) > 0:
+        elig = eligible(frontier)
+        elig[_popcount(frontier) >= budget] = False
+        s, i = (elig & ~safe).nonzero()
+        nxt = closure(frontier[s] | bit[i])
+        src.append(frontier[s])
+        act.append(i)
+        dst.append(nxt)
+        frontier = np.setdiff1d(np.unique(nxt), np.concatenate(states))
+        states.append(frontier)
+    states = np.unique(np.concatenate(states))
+    src = np.searchsorted(states, np.concatenate(src))
+    act = np.concatenate(act)
+    dst_state = np.concatenate(dst)
+    dst = np.searchsorted(states, dst_state)
+    gain = (((dst_state[:, None] & ~states[src][:, None]) & bit) != 0).dot(rew)
+
+    # 2. values by decreasing popcount (transitions increase the popcount)
+    value = np.zeros(len(states))
+    best = np.full(len(states), -1, dtype=np.int64)  # transition, -1: stop
+    count = _popcount(states)
+    trans_count = count[src]
+    for c in range(count.max(), -1, -1):
+        t = (trans_count == c).nonzero()[0]
+        if len(t) == 0:
+            continue
+        q = gain[t] + value[dst[t]]
+        # best transition per source state (stop if all < 0)
+        order = np.lexsort((-q, src[t]))
+        t, q = t[order], q[order]
+        first = np.concatenate([[True], src[t][1:] != src[t][:-1]])
+        t, q = t[first], q[first]
+        better = q > 0
+        value[src[t][better]] = q[better]
+        best[src[t][better]] = t[better]
+
+    # 3. order from the start state
+    order = []
+    closure(np.zeros(1, dtype=np.int64), order)
+    s = np.searchsorted(states, start[0])
+    total = float(rew[order].sum() + value[s])
+    while best[s] >= 0:
+        t = best[s]
+        order.append(int(act[t]))
+        closure(states[s:s+1] | bit[act[t]], order)
+        s = dst[t]
+    return total, order
+
+
+def _popcount(states):
+    count = np.zeros(len(states), dtype=np.int64)
+    states = states.copy()
+    while states.any():
+        count += states & 1
+        states >>= 1
+    return count
+
+
+def _graph_digest(graph):
+    h = hashlib.md5()
+    for arr in [graph.ANDmat, graph.ORmat, np.asarray(graph.rew_mag),
+                np.asarray(graph.subtask_id_list)]:
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(
+        description='Best achievable return of every graph of a dataset file')
+    parser.add_argument('--game_name', default='mining')
+    parser.add_argument('--graph_param', default='eval_1')
+    parser.add_argument('--game_len', default=None, type=int,
+                        help='episode length (default: no step limit)')
+    parser.add_argument('--step_cost', default=1, type=int,
+                        help='minimum number of steps per subtask')
+    args = parser.parse_args()
+
+    t = time.time()
+    solver = SubtaskSolver(args.game_name, args.graph_param, args.step_cost)
+    best = solver.solve_all(args.game_len)
+    print('{} graphs in {:.2f}s: mean {:.4f}, min {:.4f}, max {:.4f}'.format(
+        len(best), time.time() - t, best.mean(), best.min(), best.max()))
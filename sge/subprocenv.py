@@ -0,0 +1,178 @@
+import multiprocessing as mp
+import numpy as np
+from .mazeenv import load_game_config
+from .gametables import action_code
+from .utils import broadcast, spawn_seeds
+
+
+def _worker(remote, parent_remote, buffers, index, env_args, seed, auto_reset):
+    from .mazeenv import MazeEnv
+    parent_remote.close()
+    env = MazeEnv(*env_args, seed=seed)
+    bufs = {name: _as_array(buf) for name, buf in buffers.items()}
+    # the env writes its states directly into this worker's rows
+    out = {name: bufs[name][index] for name in
+           ['observation', 'mask', 'completion', 'eligibility']}
+
+    def write(state, reward, done):
+        bufs['step'][index] = state['step']
+        bufs['reward'][index] = reward
+        bufs['done'][index] = done
+        bufs['graph_index'][index] = env.graph.graph_index
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'close':
+                break
+            try:
+                if cmd == 'step':
+                    state, reward, done, _ = env.step(data, out=out)
+                    if done and auto_reset:
+                        state, _ = env.reset(out=out)
+                    write(state, reward, done)
+                elif cmd == 'reset':
+                    state, _ = env.reset(*data, out=out)
+                    write(state, 0.0, False)
+                else:
+                    raise ValueError('Unknown command: {}'.format(cmd))
+            except Exception as e:
+                remote.send(e)
+            else:
+                remote.send(None)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        remote.close()
+
+
+def _as_array(buf):
+    raw, dtype, shape = buf
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+class SubprocVecEnv(object):  # nb_env processes
+    """Runs one MazeEnv per worker process. Workers write their states into
+    shared-memory arrays and only receive action codes through a pipe, so
+    nothing is serialized per step. The returned state arrays are views of
+    the shared buffers and are overwritten by the next step/reset. The env
+    of each worker has its own random generator spawned from seed."""
+    def __init__(self, game_name, graph_param, game_len, gamma, nb_env,
+                 auto_reset=True, seed=None, start_method=None):
+        game_config, _, _ = load_game_config(game_name, graph_param)
+        self.config = game_config
+        self.nb_env = nb_env
+        self.max_task = game_config.nb_subtask_type
+        self.auto_reset = auto_reset
+
+        # shared buffers
+        N, T = nb_env, self.max_task
+        obs_shape = (game_config.nb_obj_type+3, game_config.width,
+                     game_config.height)
+        specs = [
+            ('observation', np.uint8, (N,) + obs_shape),
+            ('mask', np.float64, (N, T)),
+            ('completion', np.float64, (N, T)),
+            ('eligibility', np.float64, (N, T)),
+            ('step', np.int64, (N,)),
+            ('reward', np.float64, (N,)),
+            ('done', np.bool_, (N,)),
+            ('graph_index', np.int64, (N,)),
+        ]
+        ctx = mp.get_context(start_method)
+        buffers = dict()
+        for name, dtype, shape in specs:
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            buffers[name] = (ctx.RawArray('b', nbytes), np.dtype(dtype).str, shape)
+        self._bufs = {name: _as_array(buf) for name, buf in buffers.items()}
+
+        # workers
+        seeds = np.random.SeedSequence(seed).spawn(nb_env)
+        env_args = (game_name, graph_param, game_len, gamma)
+        self.remotes, self.processes = [], []
+        for index in range(nb_env):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker, daemon=True,
+                args=(work_remote, remote, buffers, index, env_args,
+                      seeds[index], auto_reset))
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.waiting = False
+        self.closed = False
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions):
+        assert len(actions) == self.nb_env, 'Need one action per env'
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action_code(action)))
+        self.waiting = True
+
+    def step_wait(self):
+        self.waiting = False
+        self._wait(self.remotes)
+        bufs = self._bufs
+        return self._get_state(), bufs['reward'], bufs['done'], self._get_info()
+
+    def reset(self, seed=None, graph_index=None, env_ids=None):
+        # seed / graph_index: None, scalar or one per env in env_ids
+        if env_ids is None:
+            env_ids = range(self.nb_env)
+        env_ids = np.atleast_1d(env_ids)
+        seeds = spawn_seeds(seed, len(env_ids))
+        graph_indices = broadcast(graph_index, len(env_ids))
+        remotes = [self.remotes[n] for n in env_ids]
+        for remote, sd, gind in zip(remotes, seeds, graph_indices):
+            remote.send(('reset', (sd, gind)))
+        self._wait(remotes)
+        return self._get_state(), self._get_info()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self._wait(self.remotes)
+        for remote in self.remotes:
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_actions(self):
+        return self.config.legal_actions
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
+
+    # internal
+    def _wait(self, remotes):
+        # drain every remote before raising, to keep the pipes in sync
+        errors = [remote.recv() for remote in remotes]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def _get_state(self):
+        bufs = self._bufs
+        return {
+            'observation': bufs['observation'],
+            'mask': bufs['mask'],
+            'completion': bufs['completion'],
+            'eligibility': bufs['eligibility'],
+            'step': bufs['step']
+        }
+
+    def _get_info(self):
+        return {
+            'graph_index': self._bufs['graph_index']
+        }
+
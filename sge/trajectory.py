@@ -0,0 +1,335 @@
+import json
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+from .gametables import action_code
+from .utils import KEY
+
+# Trajectory file (.sgtraj), append-only
+#   MAGIC | header length (uint32) | json header | chunk | chunk | ...
+#   chunk: CHUNK (payload bytes: uint64, nb_episode: uint32) | payload
+#   payload (zlib if header['compress']): episode | episode | ...
+#   episode: EPISODE (graph_index, seed, game_length, nb_step, flags)
+#            | action code (uint8 x nb_step) | reward (float32 x nb_step)
+#            | executed subtask index (int8 x nb_step, -1: none)
+#            | mask/completion/eligibility bits ((nb_step+1) x 3 x nb_bytes)
+#            [| reset observation (packbits of the one-hot map tensor)
+#             | number of observation deltas (uint16 x nb_step)
+#             | deltas (plane, x, y, value: uint8 x 4 x nb_delta)]
+# The bits are the subtask id-space vectors (max_task) after reset and
+# after every step. Observations are only stored if header['obs_shape'] is
+# set (store_obs): the reset observation once, then the cells changed by
+# every step. Otherwise they are reconstructed by replaying the actions from
+# the seed (see replay). flags & SAMPLED_GRAPH: the graph index was drawn by
+# reset (after seeding) instead of given.
+MAGIC = b'SGTRAJ01'
+CHUNK = struct.Struct('<QI')
+EPISODE = struct.Struct('<iqiiB')
+SAMPLED_GRAPH = 1
+EXT = '.sgtraj'
+
+
+class TrajectoryRecorder(object):
+    """Wraps a MazeEnv and appends every episode to fname. Episodes are
+    buffered into chunks of chunk_size episodes, which are compressed and
+    written by a background thread. With store_obs, the observations are
+    stored as the reset observation and the cell deltas of every step."""
+    def __init__(self, env, fname, chunk_size=64, compress=True, store_obs=False):
+        self.env = env
+        self.fname = fname
+        self.chunk_size = chunk_size
+        self.nb_bytes = (env.max_task + 7) // 8
+        header = dict(game_name=env.game_name, graph_param=env.graph_param,
+                      max_task=env.max_task, compress=compress)
+        self.store_obs = store_obs
+        if store_obs:
+            header['obs_shape'] = list(env.map.obs.shape)
+        self.compress = compress
+        self.episodes = []
+        self.episode = None
+
+        # header (new file) or check the existing one
+        try:
+            with open(fname, 'rb') as f:
+                old_header = _read_header(f)
+        except FileNotFoundError:
+            with open(fname, 'wb') as f:
+                hbytes = json.dumps(header).encode('utf-8')
+                f.write(MAGIC + struct.pack('<I', len(hbytes)) + hbytes)
+        else:
+            if old_header != header:
+                raise ValueError('{} was recorded with {}'.format(fname, old_header))
+
+        self._error = None
+        self._queue = queue.Queue(maxsize=4)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        self.closed = False
+
+    def reset(self, seed=None, graph_index=None, out=None):
+        # the seed is always recorded, so draw one if not given
+        self._end_episode()
+        if seed is None:
+            seed = int(self.env.rng.integers(2**31))
+        state, info = self.env.reset(seed, graph_index, out)
+        self.episode = dict(graph_index=self.env.graph.graph_index, seed=seed,
+                            game_length=self.env.game_length,
+                            flags=SAMPLED_GRAPH if graph_index is None else 0,
+                            actions=[], rewards=[], executed=[], bits=[])
+        self._add_bits()
+        if self.store_obs:
+            self._prev_obs = self.env.map.obs.copy()
+            self.episode['reset_obs'] = np.packbits(self._prev_obs)
+            self.episode['obs_deltas'] = []
+        return state, info
+
+    def step(self, action, out=None):
+        if self.episode is None:
+            raise RuntimeError('Recording needs the environment to be reset by the recorder')
+        state, reward, done, info = self.env.step(action, out)
+        episode = self.episode
+        episode['actions'].append(action_code(action))
+        episode['rewards'].append(reward)
+        episode['executed'].append(self.env.executed_sub_ind)
+        self._add_bits()
+        if self.store_obs:
+            self._add_obs_delta()
+        if done:
+            self._end_episode()
+        return state, reward, done, info
+
+    def flush(self):
+        # queue the buffered episodes (the current one is kept)
+        if len(self.episodes) > 0:
+            self._put(self._encode_chunk(self.episodes))
+            self.episodes = []
+
+    def close(self):
+        if self.closed:
+            return
+        self._end_episode()
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self.closed = True
+        if self._error is not None:
+            raise self._error
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # internal
+    def _add_bits(self):
+        env = self.env
+        bits = np.packbits(np.stack([env.mask_id, env.comp_id, env.elig_id]) != 0,
+                           axis=1)
+        self.episode['bits'].append(bits)
+
+    def _add_obs_delta(self):
+        # (plane, x, y, value) of the cells changed by the step
+        obs, prev = self.env.map.obs, self._prev_obs
+        changed = np.flatnonzero(obs != prev)
+        delta = np.empty((len(changed), 4), dtype=np.uint8)
+        delta[:, :3] = np.stack(np.unravel_index(changed, obs.shape), 1)
+        delta[:, 3] = obs.ravel()[changed]
+        self.episode['obs_deltas'].append(delta)
+        prev[...] = obs
+
+    def _end_episode(self):
+        if self.episode is None:
+            return
+        self.episodes.append(self.episode)
+        self.episode = None
+        if len(self.episodes) >= self.chunk_size:
+            self.flush()
+
+    def _encode_chunk(self, episodes):
+        parts = []
+        for ep in episodes:
+            parts.append(EPISODE.pack(ep['graph_index'], ep['seed'],
+                                      ep['game_length'], len(ep['actions']),
+                                      ep['flags']))
+            parts.append(np.array(ep['actions'], dtype=np.uint8).tobytes())
+            parts.append(np.array(ep['rewards'], dtype=np.float32).tobytes())
+            parts.append(np.array(ep['executed'], dtype=np.int8).tobytes())
+            parts.append(np.stack(ep['bits']).astype(np.uint8).tobytes())
+            if self.store_obs:
+                deltas = ep['obs_deltas']
+                parts.append(ep['reset_obs'].tobytes())
+                parts.append(np.array([len(d) for d in deltas],
+                                      dtype=np.uint16).tobytes())
+                parts.append(np.concatenate(
+                    [np.zeros((0, 4), dtype=np.uint8)] + deltas).tobytes())
+        payload = b''.join(parts)
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+        return CHUNK.pack(len(payload), len(episodes)) + payload
+
+    def _put(self, chunk):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(chunk)
+
+    def _write_loop(self):
+        with open(self.fname, 'ab') as f:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    break
+                if self._error is not None:
+                    continue
+                try:
+                    f.write(chunk)
+                    f.flush()
+                except Exception as e:
+                    self._error = e
+
+
+class TrajectoryReader(object):
+    """Streams the episodes of a trajectory file, one chunk at a time. An
+    incomplete last chunk (e.g. interrupted recording) is ignored."""
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            self.header = _read_header(f)
+        self.max_task = self.header['max_task']
+        self.nb_bytes = (self.max_task + 7) // 8
+        self.obs_shape = self.header.get('obs_shape')  # None: not stored
+        if self.obs_shape is not None:
+            self.obs_shape = tuple(self.obs_shape)
+
+    def __iter__(self):
+        with open(self.fname, 'rb') as f:
+            _read_header(f)
+            while True:
+                head = f.read(CHUNK.size)
+                if len(head) < CHUNK.size:
+                    return
+                nbytes, nb_episode = CHUNK.unpack(head)
+                payload = f.read(nbytes)
+                if len(payload) < nbytes:
+                    return
+                if self.header['compress']:
+                    payload = zlib.decompress(payload)
+                for episode in self._decode_chunk(payload, nb_episode):
+                    yield episode
+
+    def make_env(self, gamma=0.99, **kwargs):
+        from .mazeenv import MazeEnv
+        return MazeEnv(self.header['game_name'], self.header['graph_param'],
+                       0, gamma, **kwargs)
+
+    def _decode_chunk(self, payload, nb_episode):
+        offset = 0
+        for _ in range(nb_episode):
+            graph_index, seed, game_length, n, flags = EPISODE.unpack_from(
+                payload, offset)
+            offset += EPISODE.size
+            episode = dict(graph_index=graph_index, seed=seed,
+                           game_length=game_length, flags=flags)
+            for name, dtype, shape in [
+                    ('actions', np.uint8, (n,)), ('rewards', np.float32, (n,)),
+                    ('executed', np.int8, (n,)),
+                    ('bits', np.uint8, (n+1, 3, self.nb_bytes))]:
+                count = int(np.prod(shape))
+                episode[name] = np.frombuffer(
+                    payload, dtype=dtype, count=count, offset=offset).reshape(shape)
+                offset += count * np.dtype(dtype).itemsize
+            bits = np.unpackbits(episode.pop('bits'), axis=2)[..., :self.max_task]
+            episode['mask'] = bits[:, 0]
+            episode['completion'] = bits[:, 1]
+            episode['eligibility'] = bits[:, 2]
+            if self.obs_shape is not None:
+                offset = self._decode_obs(payload, offset, n, episode)
+            yield episode
+
+    def _decode_obs(self, payload, offset, n, episode):
+        size = int(np.prod(self.obs_shape))
+        reset_obs = np.frombuffer(payload, dtype=np.uint8,
+                                  count=(size + 7) // 8, offset=offset)
+        offset += (size + 7) // 8
+        count = np.frombuffer(payload, dtype=np.uint16, count=n, offset=offset)
+        offset += 2 * n
+        ptr = np.zeros(n+1, dtype=np.int64)
+        np.cumsum(count, out=ptr[1:])
+        episode['reset_obs'] = np.unpackbits(reset_obs, count=size).reshape(
+            self.obs_shape)
+        episode['obs_ptr'] = ptr
+        episode['obs_deltas'] = np.frombuffer(
+            payload, dtype=np.uint8, count=4*ptr[-1], offset=offset).reshape(-1, 4)
+        return offset + 4*ptr[-1]
+
+
+def replay(env, episode, out=None):
+    """Yields the (state, reward, done, info) of every step of the episode,
+    starting with (reset state, 0.0, False, info), by stepping env from the
+    recorded seed. Raises ValueError if the replay does not match the record
+    (e.g. env.rng was used between the recorded steps)."""
+    env.game_length = episode['game_length']
+    graph_index = None if episode['flags'] & SAMPLED_GRAPH else episode['graph_index']
+    state, info = env.reset(episode['seed'], graph_index, out)
+    if env.graph.graph_index != episode['graph_index']:
+        raise ValueError('Replay diverged at reset')
+    _check(env, episode, 0)
+    yield state, 0.0, False, info
+    for t, code in enumerate(episode['actions']):
+        state, reward, done, info = env.step(KEY((int(code),)), out)
+        if env.executed_sub_ind != episode['executed'][t] or \
+                np.float32(reward) != episode['rewards'][t]:
+            raise ValueError('Replay diverged at step {}'.format(t))
+        _check(env, episode, t+1)
+        yield state, reward, done, info
+
+
+def get_observations(episode, start=0, stop=None):
+    """One-hot observations (uint8, (stop-start, nb_plane, w, h)) of steps
+    start to stop-1 of an episode recorded with store_obs (0: after reset,
+    t: after the t-th step), from the reset observation and the deltas."""
+    reset_obs, ptr, deltas = episode['reset_obs'], episode['obs_ptr'], episode['obs_deltas']
+    if stop is None:
+        stop = len(ptr)
+    if not 0 <= start < stop <= len(ptr):
+        raise IndexError('Steps {}:{} of an episode of {} observations'.format(
+            start, stop, len(ptr)))
+    shape = reset_obs.shape
+    size = reset_obs.size
+    cell = np.ravel_multi_index(tuple(deltas[:, :3].T), shape)
+    sign = deltas[:, 3].astype(np.int8) * 2 - 1  # +1: set, -1: cleared
+    # 1. observation at start
+    base = reset_obs.ravel() + np.bincount(
+        cell[:ptr[start]], weights=sign[:ptr[start]], minlength=size)
+    # 2. cumulative changes of the next steps (a cell changes once per step)
+    change = np.zeros((stop - start, size), dtype=np.int8)
+    lo, hi = ptr[start], ptr[stop-1]
+    row = np.repeat(np.arange(1, stop - start), np.diff(ptr[start:stop]))
+    change[row, cell[lo:hi]] = sign[lo:hi]
+    obs = np.cumsum(change, axis=0, dtype=np.int8)
+    obs += base.astype(np.int8)
+    return obs.view(np.uint8).reshape((stop - start,) + shape)
+
+
+def get_observation(episode, t):
+    # observation after the t-th step (0: reset) of an episode recorded with store_obs
+    return get_observations(episode, t, t+1)[0]
+
+
+def _check(env, episode, t):
+    if not (np.array_equal(env.mask_id != 0, episode['mask'][t] != 0) and
+            np.array_equal(env.comp_id != 0, episode['completion'][t] != 0) and
+            np.array_equal(env.elig_id != 0, episode['eligibility'][t] != 0)):
+        raise ValueError('Replay diverged at step {}'.format(t))
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a trajectory file: {}'.format(f.name))
+    hlen, = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(hlen).decode('utf-8'))
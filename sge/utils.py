@@ -35,6 +35,23 @@ TYPE_PICKUP = 0
 TYPE_TRANSFORM = 1
 
 
+def broadcast(value, size):
+    # None, a scalar or one value per env -> list of size values
+    if value is None:
+        return [None]*size
+    if np.ndim(value) == 0:
+        return [value]*size
+    assert len(value) == size, 'Need one value per env'
+    return list(value)
+
+
+def spawn_seeds(seed, size):
+    # reset seeds of size envs: a scalar seed spawns one SeedSequence per env
+    if seed is not None and np.ndim(seed) == 0:
+        return np.random.SeedSequence(seed).spawn(size)
+    return broadcast(seed, size)
+
+
 def get_id_from_ind_multihot(indexed_tensor, mapping, max_dim):
     if type(mapping) == dict:
         mapping_ = np.zeros(max(mapping.keys())+1, dtype=np.long)
@@ -0,0 +1,398 @@
+import numpy as np
+from .graph import SubtaskGraph
+from .mazeenv import load_game_config
+from .mazemap import Mazemap, RAND_BUFFER, NEIGHBORS
+from .gametables import ACTION_CODE
+from .obsencoding import ObsEncoder
+from .utils import AGENT, BLOCK, WATER, OBJ_BIAS, TYPE_PICKUP, TYPE_TRANSFORM, \
+    broadcast, spawn_seeds
+
+
+class VecMazeEnv(object):  # nb_env batches
+    """Steps nb_env mazes at once. All the per-env states (map, agent,
+    objects, subtask status and graph) are stacked in (nb_env, ...) arrays,
+    and the subtask vectors are kept in subtask id space (max_task)."""
+    def __init__(self, game_name, graph_param, game_len, gamma, nb_env, seed=None,
+                 obs_encoding='onehot'):
+        game_config, graph_folder, filename = load_game_config(
+            game_name, graph_param)
+        self.config = game_config
+        self.nb_env = nb_env
+        self.max_task = self.config.nb_subtask_type
+        self.subtask_list = self.config.subtask_list
+        self.gamma = gamma
+        self.step_reward = 0.0
+
+        # graph & map (a single map generator is shared by all envs)
+        self.graph = SubtaskGraph(graph_folder, filename, self.max_task)
+        self.map = Mazemap(game_name, game_config, {})
+        self.w, self.h = self.map.w, self.map.h
+        self.obs_encoder = ObsEncoder(obs_encoding, self.map.obs.shape)
+        self._build_tables()
+
+        N, T = nb_env, self.max_task
+        # map tensor
+        self.obs = np.zeros(
+            (N, self.config.nb_obj_type+3, self.w, self.h), dtype=np.uint8)
+        self.item_map = np.full((N, self.w, self.h), -1, dtype=np.int16)
+        self.agent_x = np.zeros(N, dtype=np.int64)
+        self.agent_y = np.zeros(N, dtype=np.int64)
+        # object list (kept in the same order as Mazemap.objects)
+        self.obj_oid = np.zeros((N, self.max_obj), dtype=np.int64)
+        self.obj_x = np.zeros((N, self.max_obj), dtype=np.int64)
+        self.obj_y = np.zeros((N, self.max_obj), dtype=np.int64)
+        self.nb_obj = np.zeros(N, dtype=np.int64)
+
+        # subtask graph of each env (index in the graph tables)
+        self.graph_index = np.full(N, -1, dtype=np.int64)
+        self.present = np.zeros((N, T), dtype=np.bool_)
+        self.rew_mag = np.zeros((N, T))
+
+        # subtask status
+        self.mask_id = np.zeros((N, T), dtype=np.uint8)
+        self.comp_id = np.zeros((N, T), dtype=np.uint8)
+        self.elig_id = np.zeros((N, T), dtype=np.bool_)
+        self.executed_sub_id = np.full(N, -1, dtype=np.int64)
+
+        # init
+        self.seed(seed)
+        self.game_length = np.array([int(rng.uniform(
+            0.8, 1.2) * game_len) for rng in self.rngs], dtype=np.int64)
+        self.step_count = np.zeros(N, dtype=np.int64)
+        self.ret = np.zeros(N)
+        self.reward = np.zeros(N)
+        self.game_over = np.zeros(N, dtype=np.bool_)
+        self.time_over = np.zeros(N, dtype=np.bool_)
+        self._reset_flag = np.zeros(N, dtype=np.bool_)
+        # random numbers of the moving objects (see Mazemap._random)
+        self.rand_buf = np.zeros((N, RAND_BUFFER))
+        self.rand_pos = np.full(N, RAND_BUFFER, dtype=np.int64)
+
+    def step(self, actions, out=None, env_ids=None):
+        # steps the envs in env_ids (all envs by default), one action per env
+        if env_ids is None:
+            env_ids = np.arange(self.nb_env)
+        env_ids = np.atleast_1d(env_ids)
+        if not self._reset_flag[env_ids].all():
+            raise RuntimeError('Error: Environment has never been reset()')
+        if (self.game_over | self.time_over)[env_ids].any():
+            raise ValueError(
+                'Environment has already been terminated. need to be reset!')
+        codes = self._get_action_codes(actions, len(env_ids))
+        oid = self._act(env_ids, codes)
+
+        # (action, item) -> subtask id, if it is one of the subtasks in graph
+        sub_id = np.full(len(env_ids), -1, dtype=np.int64)
+        has_obj = oid >= 0
+        sub_id[has_obj] = self.subtask_table[codes[has_obj], oid[has_obj]]
+        index = (sub_id >= 0).nonzero()[0]
+        sub_id[index[~self.present[env_ids[index], sub_id[index]]]] = -1
+
+        self.reward = np.zeros(self.nb_env)
+        self.reward[env_ids] = self._act_subtask(env_ids, sub_id)
+        self.ret += self.reward*self.gamma
+        self.step_count[env_ids] += 1
+        self.time_over = self.step_count >= self.game_length
+        self.game_over[env_ids] = \
+            ~np.logical_and(self.elig_id[env_ids], self.mask_id[env_ids]).any(1)
+
+        return self._get_state(out), self.reward.copy(), \
+            self.game_over | self.time_over, self._get_info()
+
+    def reset(self, seed=None, graph_index=None, env_ids=None, out=None):
+        # seed / graph_index: None, scalar or one per env in env_ids
+        if env_ids is None:
+            env_ids = np.arange(self.nb_env)
+        env_ids = np.atleast_1d(env_ids)
+        seeds = spawn_seeds(seed, len(env_ids))
+        graph_indices = broadcast(graph_index, len(env_ids))
+
+        for n, sd, gind in zip(env_ids, seeds, graph_indices):
+            if sd is not None:
+                self.rngs[n] = np.random.default_rng(sd)
+            rng = self.rngs[n]
+            if gind is None:
+                gind = rng.integers(self.graph.num_graph)
+            else:
+                gind = gind % self.graph.num_graph
+
+            # 1. reset graph
+            self._load_graph(n, gind)
+
+            # 2. reset subtask status
+            self.executed_sub_id[n] = -1
+            self.mask_id[n] = self.present[n]
+            self.comp_id[n] = 0
+
+            # 3. reset map
+            self.map.rng = rng
+            stack = self.graph.get_stack()
+            self.map.reset(stack.ind_to_id[gind, :stack.nb_subtask[gind]].tolist())
+            self._load_map(n)
+
+        self._compute_elig(env_ids)
+        self.rand_pos[env_ids] = RAND_BUFFER
+        self.step_count[env_ids] = 0
+        self.ret[env_ids] = 0
+        self.reward[env_ids] = 0
+        self.game_over[env_ids] = False
+        self.time_over[env_ids] = False
+        self._reset_flag[env_ids] = True
+        return self._get_state(out), self._get_info()
+
+    def state_spec(self):
+        return [
+            {'dtype': dtype, 'name': name, 'shape': shape}
+            for name, dtype, shape in self.obs_encoder.spec((self.nb_env,))] + [
+            {'dtype': self.mask_id.dtype, 'name': 'mask', 'shape': self.mask_id.shape},
+            {'dtype': self.comp_id.dtype, 'name': 'completion', 'shape': self.comp_id.shape},
+            {'dtype': self.elig_id.dtype, 'name': 'eligibility', 'shape': self.elig_id.shape},
+            {'dtype': int, 'name': 'step', 'shape': (self.nb_env,)}
+        ]
+
+    def get_actions(self):
+        return self.config.legal_actions
+
+    def seed(self, seed=None):
+        # one generator per env, spawned from seed
+        children = np.random.SeedSequence(seed).spawn(self.nb_env)
+        self.rngs = [np.random.default_rng(child) for child in children]
+
+    def render(self, mode='rgb_array', tile_size=None, out=None):
+        # (nb_env, h*tile_size, w*tile_size, 3) uint8 images of the maps
+        if mode != 'rgb_array':
+            raise ValueError("Unsupported render mode: {}".format(mode))
+        return self.map.get_rgb_renderer(tile_size).render(
+            self.item_map, self.agent_x, self.agent_y, out)
+
+    def new_state_buffer(self, dtype=np.float64):
+        # preallocated state to be filled by step/reset(out=...)
+        N, T = self.nb_env, self.max_task
+        state = {name: np.zeros(shape, dtype=obs_dtype)
+                 for name, obs_dtype, shape in self.obs_encoder.spec((N,))}
+        state.update({
+            'mask': np.zeros((N, T), dtype=dtype),
+            'completion': np.zeros((N, T), dtype=dtype),
+            'eligibility': np.zeros((N, T), dtype=dtype),
+            'step': np.zeros(N, dtype=np.int64)
+        })
+        return state
+
+    # internal
+    def _build_tables(self):
+        # action / object / subtask tables of the game config (see GameTables)
+        tables = self.map.tables
+        self.legal_code, self.move_code = tables.legal_code, tables.move_code
+        self.oper_type, self.dx, self.dy = tables.oper_type, tables.dx, tables.dy
+        self.speed, self.pickable = tables.speed, tables.pickable
+        self.transformable, self.outcome = tables.transformable, tables.outcome
+        self.subtask_table = tables.subtask_table
+        self.max_obj = tables.max_obj
+
+        # graph tables (num_graph, ...) in subtask id space
+        stack = self.graph.get_stack()
+        self.graph_ANDmat, self.graph_ORmat, self.graph_b_OR, \
+            self.graph_rew_mag, self.graph_present = stack.to_id_space(self.max_task)
+        self.graph_b_AND = stack.b_AND
+        self.max_and = self.graph_ANDmat.shape[1]
+
+    def _get_action_codes(self, actions, size):
+        if isinstance(actions, np.ndarray) and actions.dtype.kind in 'iu':
+            codes = actions.astype(np.int64)
+        else:
+            codes = np.array([ACTION_CODE[action] for action in actions],
+                             dtype=np.int64)
+        assert codes.shape == (size,), 'Need one action per env'
+        legal = (codes >= 0) & (codes < len(self.legal_code))
+        legal[legal] = self.legal_code[codes[legal]]
+        assert legal.all(), 'Illegal action: {}'.format(codes[~legal])
+        return codes
+
+    def _load_graph(self, n, graph_index):
+        self.graph_index[n] = graph_index
+        self.present[n] = self.graph_present[graph_index]
+        self.rew_mag[n] = self.graph_rew_mag[graph_index]
+
+    def _load_map(self, n):
+        maze = self.map
+        self.obs[n] = maze.obs
+        self.item_map[n] = maze.item_map
+        self.agent_x[n], self.agent_y[n] = maze.agent_x, maze.agent_y
+        self.nb_obj[n] = len(maze.objects)
+        for k, obj in enumerate(maze.objects):
+            self.obj_oid[n, k] = obj.oid
+            self.obj_x[n, k], self.obj_y[n, k] = obj.pos
+
+    def _act(self, env_ids, codes):
+        oid = np.full(len(env_ids), -1, dtype=np.int64)
+        # 1. move (blocked by walls and waters)
+        move = self.move_code[codes]
+        x, y = self.agent_x[env_ids], self.agent_y[env_ids]
+        new_x, new_y = x + self.dx[codes], y + self.dy[codes]
+        item = self.item_map[env_ids, new_x, new_y]
+        index = (move & (item != BLOCK) & (item != WATER)).nonzero()[0]
+        rows = env_ids[index]
+        self.obs[rows, AGENT, x[index], y[index]] = 0
+        self.agent_x[rows], self.agent_y[rows] = new_x[index], new_y[index]
+        self.obs[rows, AGENT, new_x[index], new_y[index]] = 1
+
+        # 2. perform
+        iid = self.item_map[env_ids, self.agent_x[env_ids], self.agent_y[env_ids]]
+        index = (~move & (iid > -1)).nonzero()[0]
+        oid[index] = iid[index] - OBJ_BIAS
+        if len(index) > 0:
+            self._perform(env_ids[index], codes[index], oid[index])
+        self._process_obj(env_ids)  # moving objects
+        return oid
+
+    def _perform(self, rows, codes, oid):
+        slot = np.arange(self.max_obj)
+        here = (self.obj_x[rows] == self.agent_x[rows, None]) & \
+            (self.obj_y[rows] == self.agent_y[rows, None]) & \
+            (slot < self.nb_obj[rows, None])
+        assert here.any(1).all()
+        index = here.argmax(1)
+
+        act_type = self.oper_type[codes]
+        pickup = (act_type == TYPE_PICKUP) & self.pickable[oid]
+        transform = (act_type == TYPE_TRANSFORM) & self.transformable[oid]
+        remove = pickup | transform
+        self._remove_item(rows[remove], index[remove])
+        self._add_item(rows[transform], self.outcome[oid[transform]],
+                       self.agent_x[rows[transform]],
+                       self.agent_y[rows[transform]])
+
+    def _process_obj(self, env_ids):
+        # Same moves and random numbers as Mazemap._process_obj: the object
+        # of slot k reads u[:, :, k] of the env's draw, and the objects of an
+        # env move one by one in slot order. Round r moves the r-th moving
+        # object of every env at once.
+        slot = np.arange(self.max_obj)
+        moving = np.zeros(self.nb_env, dtype=np.bool_)
+        moving[env_ids] = ((self.speed[self.obj_oid[env_ids]] > 0) &
+                           (slot < self.nb_obj[env_ids, None])).any(1)
+        if not moving.any():  # no random number is drawn
+            return
+        live = slot < self.nb_obj[:, None]
+        speed = self.speed[self.obj_oid]
+        u = self._random(moving)
+        rows, k = (live & moving[:, None] & (u[:, 0] < speed)).nonzero()
+        if len(rows) == 0:
+            return
+        # rows is sorted, so the rank of a mover in its env is its distance
+        # to the first mover of the env
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        for r in range(rank.max() + 1):
+            sel = (rank == r).nonzero()[0]
+            self._move_objects(rows[sel], k[sel], u[rows[sel], 1, k[sel]])
+
+    def _move_objects(self, rows, k, u):
+        # moves the object of slot k of each env (distinct) rows to the
+        # int(u*nb_empty)-th of its empty neighbors
+        x, y = self.obj_x[rows, k], self.obj_y[rows, k]
+        cand_x = x[:, None] + NEIGHBORS[:, 0]
+        cand_y = y[:, None] + NEIGHBORS[:, 1]
+        empty = self.item_map[rows[:, None], cand_x, cand_y] == -1
+        nb_empty = empty.sum(1)
+        pick = (u * nb_empty).astype(np.int64)
+        choice = (empty & (empty.cumsum(1) == pick[:, None]+1)).argmax(1)
+        go = (nb_empty > 0).nonzero()[0]
+        rows, k, x, y = rows[go], k[go], x[go], y[go]
+        new_x, new_y = cand_x[go, choice[go]], cand_y[go, choice[go]]
+        iid = self.obj_oid[rows, k] + OBJ_BIAS
+        self.obs[rows, iid, x, y] = 0
+        self.item_map[rows, x, y] = -1
+        self.obs[rows, iid, new_x, new_y] = 1
+        self.item_map[rows, new_x, new_y] = iid
+        self.obj_x[rows, k], self.obj_y[rows, k] = new_x, new_y
+
+    def _random(self, moving):
+        # u[n, i, k] = Mazemap._random(2*nb_obj)[i*nb_obj + k] of the moving envs
+        nb_use = 2 * self.nb_obj * moving
+        for n in (self.rand_pos + nb_use > RAND_BUFFER).nonzero()[0]:
+            self.rand_buf[n] = self.rngs[n].random(RAND_BUFFER)
+            self.rand_pos[n] = 0
+        slot = np.arange(self.max_obj)
+        index = self.rand_pos[:, None, None] + \
+            np.arange(2)[:, None] * self.nb_obj[:, None, None] + slot
+        index = np.minimum(index, RAND_BUFFER-1).reshape(self.nb_env, -1)
+        u = np.take_along_axis(self.rand_buf, index, 1).reshape(
+            self.nb_env, 2, self.max_obj)
+        self.rand_pos += nb_use
+        return u
+
+    def _remove_item(self, rows, index):
+        oid = self.obj_oid[rows, index]
+        x, y = self.obj_x[rows, index], self.obj_y[rows, index]
+        self.obs[rows, oid+OBJ_BIAS, x, y] = 0
+        self.item_map[rows, x, y] = -1
+        # shift the list left over the removed slot
+        slot = np.arange(self.max_obj)
+        src = np.minimum(slot + (slot >= index[:, None]), self.max_obj-1)
+        self.obj_oid[rows] = np.take_along_axis(self.obj_oid[rows], src, 1)
+        self.obj_x[rows] = np.take_along_axis(self.obj_x[rows], src, 1)
+        self.obj_y[rows] = np.take_along_axis(self.obj_y[rows], src, 1)
+        self.nb_obj[rows] -= 1
+
+    def _add_item(self, rows, oid, x, y):
+        index = self.nb_obj[rows]
+        self.obs[rows, oid+OBJ_BIAS, x, y] = 1
+        self.item_map[rows, x, y] = oid+OBJ_BIAS
+        self.obj_oid[rows, index] = oid
+        self.obj_x[rows, index], self.obj_y[rows, index] = x, y
+        self.nb_obj[rows] += 1
+
+    def _act_subtask(self, env_ids, sub_id):
+        # reward of each env of env_ids (sub_id: executed subtask, -1 if none)
+        self.executed_sub_id[env_ids] = -1
+        reward = np.full(len(env_ids), self.step_reward)
+        index = (sub_id >= 0).nonzero()[0]
+        rows, sub_id = env_ids[index], sub_id[index]
+        success = self.elig_id[rows, sub_id] & (self.mask_id[rows, sub_id] == 1)
+        rows_s, sub_id_s = rows[success], sub_id[success]
+        self.comp_id[rows_s, sub_id_s] = 1
+        reward[index[success]] += self.rew_mag[rows_s, sub_id_s]
+        self.executed_sub_id[rows_s] = sub_id_s
+        self.mask_id[rows, sub_id] = 0
+
+        # eligibility only changes when the completion changes
+        if len(rows_s) > 0:
+            self._compute_elig(rows_s)
+        return reward
+
+    def _compute_elig(self, rows):
+        graphs = self.graph_index[rows]
+        tp = self.comp_id[rows].astype(np.float32)*2-1  # \in {-1,1}
+        # sign(A x tp + b) (+1 or 0), int8 graph tables evaluated in float32
+        ANDout = np.matmul(self.graph_ANDmat[graphs].astype(np.float32),
+                           tp[..., None])[..., 0] \
+            - self.graph_b_AND[graphs] >= 0
+        ORout = np.matmul(self.graph_ORmat[graphs].astype(np.float32),
+                          ANDout[..., None].astype(np.float32))[..., 0] \
+            - self.graph_b_OR[graphs] >= 0
+        self.elig_id[rows] = ORout & self.present[rows]
+
+    def _get_state(self, out=None):
+        step = self.game_length - self.step_count
+        if out is not None:
+            self.obs_encoder.encode(
+                self.obs, self.item_map, self.agent_x, self.agent_y, out)
+            out['mask'][...] = self.mask_id
+            out['completion'][...] = self.comp_id
+            out['eligibility'][...] = self.elig_id
+            np.subtract(self.game_length, self.step_count, out=out['step'])
+            return out
+        state = self.obs_encoder.encode(
+            self.obs, self.item_map, self.agent_x, self.agent_y)
+        state.update({
+            'mask': self.mask_id.astype(np.float64),
+            'completion': self.comp_id.astype(np.float64),
+            'eligibility': self.elig_id.astype(np.float64),
+            'step': step
+        })
+        return state
+
+    def _get_info(self):
+        return {
+            'graph_index': self.graph_index.copy()
+        }
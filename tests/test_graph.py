@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import sge.graph
+from sge.graph import SubtaskGraph, SparseGraph
+
+DATASETS = [('subtask_graph_play', 'play_D1_train_1'), ('subtask_graph_play', 'play_D4_eval_1'),
+            ('subtask_graph_mining', 'mining_train_1')]
+
+
+@pytest.mark.parametrize('folder, filename', DATASETS)
+def test_incremental_matches_matrix(folder, filename):
+    # reset_elig / update_elig of the incremental engine give the matrix
+    # formula on random completions and random single-subtask flips
+    matrix = SubtaskGraph('data/' + folder, filename, elig_engine='matrix')
+    incremental = SubtaskGraph('data/' + folder, filename, elig_engine='incremental')
+    rng = np.random.RandomState(0)
+    for graph_index in rng.choice(matrix.num_graph, 10, replace=False):
+        matrix.set_graph_index(graph_index)
+        incremental.set_graph_index(graph_index)
+        completion = rng.randint(2, size=matrix.nb_subtask)
+        expected = matrix.get_elig(completion)
+        assert np.array_equal(incremental.reset_elig(completion), expected)
+        for sub_ind in rng.randint(matrix.nb_subtask, size=50):
+            completion[sub_ind] = 1 - completion[sub_ind]
+            previous, expected = expected, matrix.get_elig(completion)
+            elig, changed = incremental.update_elig(completion, sub_ind)
+            assert np.array_equal(elig, expected)
+            assert sorted(changed) == np.flatnonzero(previous != expected).tolist()
+
+
+def test_sparse_graph_round_trip():
+    graph = SubtaskGraph('data/subtask_graph_play', 'play_D4_eval_1')
+    graph.set_graph_index(3)
+    sparse = SparseGraph.from_dense(graph.ANDmat, graph.ORmat, graph.b_OR)
+    ANDmat, ORmat, b_AND, b_OR = sparse.to_dense()
+    assert np.array_equal(ANDmat, graph.ANDmat)
+    assert np.array_equal(ORmat, graph.ORmat)
+    assert np.array_equal(b_AND, graph.b_AND)
+    assert np.array_equal(b_OR, graph.b_OR)
+
+
+def test_engine_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(sge.graph, 'ENGINE_CACHE_SIZE', 4)
+    graph = SubtaskGraph('data/subtask_graph_play', 'play_D1_train_1', elig_engine='incremental')
+    for graph_index in range(10):
+        graph.set_graph_index(graph_index)
+    assert list(graph._engine_cache) == [6, 7, 8, 9]
+    graph.set_graph_index(7)
+    assert list(graph._engine_cache) == [6, 8, 9, 7]
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from sge import graphpack
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'sge', 'data')
+
+
+def _load_npy(folder, filename):
+    return np.load(os.path.join(DATA_DIR, folder, filename + '.npy'), allow_pickle=True)
+
+
+def _check_same_graph(graph, packed):
+    assert sorted(packed) == sorted(graph)
+    for key in ['ANDmat', 'ORmat']:
+        assert packed[key].dtype == graph[key].dtype
+        assert np.array_equal(packed[key], graph[key])
+    for key in ['W_a', 'W_o']:
+        assert len(packed[key]) == len(graph[key])
+        for w, pw in zip(graph[key], packed[key]):
+            assert pw.dtype == w.dtype
+            assert np.array_equal(pw, w)
+    assert list(packed['rmag']) == list(graph['rmag'])
+    assert np.array_equal(packed['trind'], graph['trind'])
+
+
+@pytest.mark.parametrize('folder, filename', [
+    ('subtask_graph_play', 'play_D4_eval_1'), ('subtask_graph_mining', 'mining_train_1')])
+def test_round_trip(tmp_path, folder, filename):
+    graph_list = _load_npy(folder, filename)
+    fname = str(tmp_path / ('graphs' + graphpack.EXT))
+    graphpack.pack_graph_list(graph_list, fname)
+    packed = graphpack.PackedGraphList(fname)
+    assert len(packed) == len(graph_list)
+    for graph, packed_graph in zip(graph_list, packed):
+        _check_same_graph(graph, packed_graph)
+
+    # padded stacks of all the graphs
+    for name, key in [('and', 'ANDmat'), ('or', 'ORmat')]:
+        stack = packed.get_padded(name, np.int8, chunk_size=7)
+        for i, graph in enumerate(graph_list):
+            h, w = graph[key].shape
+            assert np.array_equal(stack[i, :h, :w], graph[key])
+            assert not stack[i, h:].any() and not stack[i, :, w:].any()
+    trind = packed.get_padded_subtasks('trind', fill=-1, dtype=np.int64)
+    for i, graph in enumerate(graph_list):
+        n = len(graph['trind'])
+        assert np.array_equal(trind[i, :n], graph['trind'])
+        assert (trind[i, n:] == -1).all()
+
+
+def test_streamed_batches(tmp_path):
+    # adding the graphs in several calls gives the same file as one call
+    graph_list = list(_load_npy('subtask_graph_play', 'play_D1_train_1')[:20])
+    empty = dict(graph_list[0])
+    empty['ANDmat'] = np.zeros_like(empty['ANDmat'])
+    empty['ORmat'] = np.zeros_like(empty['ORmat'])
+    graph_list.append(empty)
+    one = str(tmp_path / 'one.sgpack')
+    many = str(tmp_path / 'many.sgpack')
+    graphpack.pack_graph_list(graph_list, one)
+    with graphpack.GraphPackWriter(many, graph_list[0]['ANDmat'].dtype) as writer:
+        writer.add(graph_list[0])
+        writer.add_graphs(graph_list[1:8])
+        writer.add_batch(graphpack.flatten_graphs(graph_list[8:], writer.dtype))
+    with open(one, 'rb') as f1, open(many, 'rb') as f2:
+        assert f1.read() == f2.read()
+    packed = graphpack.PackedGraphList(many)
+    for graph, packed_graph in zip(graph_list, packed):
+        _check_same_graph(graph, packed_graph)
+
+
+def test_bad_file(tmp_path):
+    fname = str(tmp_path / 'old.sgpack')
+    with open(fname, 'wb') as f:
+        f.write(b'SGPACK01' + bytes(64))
+    with pytest.raises(ValueError, match='Outdated'):
+        graphpack.PackedGraphList(fname)
+    with open(fname, 'wb') as f:
+        f.write(bytes(64))
+    with pytest.raises(ValueError, match='Not a packed'):
+        graphpack.PackedGraphList(fname)
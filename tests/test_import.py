@@ -0,0 +1,10 @@
+from sge.benchmark import check_import, IMPORT_BUDGET_MS
+
+
+def test_import_budget():
+    # import sge in a fresh interpreter: no rendering package. The timing
+    # depends on the machine, so only a gross regression (10x the budget)
+    # fails; sge.benchmark --check_import checks the budget itself.
+    result = check_import(IMPORT_BUDGET_MS * 10)
+    print('import sge: {:.1f}ms (budget {}ms)'.format(result['import_ms'], IMPORT_BUDGET_MS))
+    assert result['render_modules'] == []
@@ -0,0 +1,79 @@
+import random
+from collections import deque
+
+import numpy as np
+import pytest
+
+from sge.mazeenv import MazeEnv
+from sge.utils import AGENT, BLOCK, WATER, OBJ_BIAS
+
+GAMES = [('playground', 'D1_train_1'), ('mining', 'train_1')]
+
+
+def _check_map(mazemap):
+    # the grids, the observation planes and the object list agree
+    item_map = mazemap.item_map
+    obs = mazemap.get_obs()
+    expected = np.full(item_map.shape, -1)
+    expected[obs[BLOCK] == 1] = BLOCK
+    expected[obs[WATER] == 1] = WATER
+    assert np.array_equal(mazemap.passable, (item_map != BLOCK) & (item_map != WATER))
+    nb_moving = 0
+    for obj in mazemap.objects:
+        x, y = obj.pos
+        assert mazemap.obj_grid[x, y] is obj
+        assert obs[obj.oid + OBJ_BIAS, x, y] == 1
+        expected[x, y] = obj.oid + OBJ_BIAS
+        nb_moving += mazemap.speed[obj.oid] > 0
+    assert np.array_equal(item_map, expected)
+    assert np.count_nonzero(mazemap.obj_grid != None) == len(mazemap.objects)  # noqa: E711
+    assert obs[OBJ_BIAS:].sum() == len(mazemap.objects)
+    assert mazemap.nb_moving == nb_moving
+    assert obs[AGENT].sum() == 1 and obs[AGENT, mazemap.agent_x, mazemap.agent_y] == 1
+
+
+@pytest.mark.parametrize('game_name, graph_param', GAMES)
+def test_map_consistency(game_name, graph_param):
+    env = MazeEnv(game_name, graph_param, 60, 0.99)
+    actions = sorted(env.get_actions(), key=lambda action: action.value[0])
+    rng = random.Random(0)
+    for episode in range(5):
+        env.reset(seed=episode)
+        _check_map(env.map)
+        done = False
+        while not done:
+            _, _, done, _ = env.step(rng.choice(actions))
+            _check_map(env.map)
+
+
+def _bfs(passable, x, y):
+    dist = np.full(passable.shape, -1)
+    dist[x, y] = 0
+    queue = deque([(x, y)])
+    while queue:
+        x, y = queue.popleft()
+        for nx, ny in [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]:
+            if passable[nx, ny] and dist[nx, ny] < 0:
+                dist[nx, ny] = dist[x, y] + 1
+                queue.append((nx, ny))
+    return dist
+
+
+@pytest.mark.parametrize('game_name, graph_param', GAMES)
+def test_distances(game_name, graph_param):
+    # distance fields are the BFS distances over the passable cells
+    env = MazeEnv(game_name, graph_param, 60, 0.99)
+    for seed in range(3):
+        env.reset(seed=seed)
+        mazemap = env.map
+        for x, y in zip(*mazemap.passable.nonzero()):
+            assert np.array_equal(mazemap.distance_map(x, y), _bfs(mazemap.passable, x, y))
+        for x, y in zip(*(~mazemap.passable).nonzero()):
+            assert (mazemap.distance_map(x, y) == -1).all()
+
+        dist = _bfs(mazemap.passable, mazemap.agent_x, mazemap.agent_y)
+        assert mazemap.object_distances().tolist() == [dist[obj.pos] for obj in mazemap.objects]
+        nearest = mazemap.nearest_object_distances()
+        for oid in range(mazemap.config.nb_obj_type):
+            d = [dist[obj.pos] for obj in mazemap.objects if obj.oid == oid]
+            assert nearest[oid] == (min(d) if d else -1)
@@ -0,0 +1,27 @@
+import random
+
+from sge.mazeenv import MazeEnv
+
+
+def test_step_phases():
+    # every step phase is ticked once per step, the eligibility phases once
+    # per completed subtask
+    env = MazeEnv('playground', 'D1_train_1', 60, 0.99, profile=True)
+    actions = sorted(env.get_actions(), key=lambda action: action.value[0])
+    rng = random.Random(0)
+    nb_step = 0
+    for episode in range(5):
+        env.reset(seed=episode)
+        done = False
+        while not done:
+            _, _, done, _ = env.step(rng.choice(actions))
+            nb_step += 1
+    result = env.profiler.snapshot()
+    step = result['step']
+    nb_completion = result['counters']['subtask_completions']
+    assert nb_completion > 0
+    assert step['calls'] == nb_step
+    for phase in ['act', 'process_obj', 'subtask_lookup', 'act_subtask', 'get_state']:
+        assert step['phases'][phase]['calls'] == nb_step, phase
+    for phase in ['get_elig', 'get_id']:
+        assert step['phases'][phase]['calls'] == nb_completion, phase
@@ -0,0 +1,74 @@
+import glob
+import hashlib
+import os
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from sge.rgbrender import _read_png
+
+ICON_DIR = os.path.join(os.path.dirname(__file__), '..', 'sge', 'asset')
+
+
+def _chunk(chunk_type, data):
+    return (struct.pack('>I', len(data)) + chunk_type + data +
+            struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def _write_png(fname, img):
+    # uint8 (h, w, 3 or 4) image with the row filters 0, 1, 2, 3, 4, 0, ...
+    h, w, c = img.shape
+    rows = img.reshape(h, w*c).astype(np.int64)
+    raw = b''
+    for y in range(h):
+        filter_type = y % 5
+        cur = rows[y]
+        up = rows[y-1] if y > 0 else np.zeros(w*c, dtype=np.int64)
+        a = np.concatenate([np.zeros(c, dtype=np.int64), cur[:-c]])
+        d = np.concatenate([np.zeros(c, dtype=np.int64), up[:-c]])
+        if filter_type == 0:
+            pred = np.zeros(w*c, dtype=np.int64)
+        elif filter_type == 1:
+            pred = a
+        elif filter_type == 2:
+            pred = up
+        elif filter_type == 3:
+            pred = (a + up) // 2
+        else:
+            p = a + up - d
+            pa, pb, pd = abs(p - a), abs(p - up), abs(p - d)
+            pred = np.where((pa <= pb) & (pa <= pd), a, np.where(pb <= pd, up, d))
+        raw += bytes([filter_type]) + ((cur - pred) % 256).astype(np.uint8).tobytes()
+    color_type = 2 if c == 3 else 6
+    with open(fname, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, color_type, 0, 0, 0)))
+        f.write(_chunk(b'IDAT', zlib.compress(raw)))
+        f.write(_chunk(b'IEND', b''))
+
+
+@pytest.mark.parametrize('c', [3, 4])
+def test_read_png_filters(tmp_path, c):
+    img = np.random.RandomState(c).randint(256, size=(11, 7, c)).astype(np.uint8)
+    fname = str(tmp_path / 'img.png')
+    _write_png(fname, img)
+    out = _read_png(fname)
+    assert out.dtype == np.uint8
+    assert np.array_equal(out, img)
+
+
+def test_read_png_icon():
+    img = _read_png(os.path.join(ICON_DIR, 'playground', 'Icon', 'heart.png'))
+    assert img.shape == (32, 32, 4)
+    assert hashlib.md5(img.tobytes()).hexdigest().startswith('117b0dd22ba1')
+
+
+def test_read_png_matches_matplotlib():
+    image = pytest.importorskip('matplotlib.image')
+    fnames = sorted(glob.glob(os.path.join(ICON_DIR, '*', 'Icon', '*.png')))
+    assert fnames
+    for fname in fnames:
+        ref = np.round(image.imread(fname) * 255).astype(np.uint8)
+        assert np.array_equal(_read_png(fname), ref), fname
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from sge.mazeenv import MazeEnv
+from sge.server import EnvServer, EnvClient
+from sge.utils import KEY
+
+GAME = ('mining', 'eval_1', 50, 0.99)
+
+
+@pytest.fixture
+def server_path(tmp_path):
+    # EnvServer of 2 envs, served by an event loop in a background thread
+    path = str(tmp_path / 'sge.sock')
+    loop = asyncio.new_event_loop()
+    server = EnvServer(*GAME, nb_env=2)
+    loop.run_until_complete(server.start(path))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield path
+    asyncio.run_coroutine_threadsafe(_shutdown(server), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+async def _shutdown(server):
+    # stop accepting clients and let the connection handlers finish
+    server.close()
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    await asyncio.gather(*tasks)
+
+
+def _play(path, seed, nb_step, errors):
+    # the remote env must give the same states and rewards as a local MazeEnv
+    try:
+        env = MazeEnv(*GAME, state_dtype=np.uint8)
+        actions = sorted(env.get_actions(), key=lambda key: key.value[0])
+        rng = np.random.RandomState(seed)
+        with EnvClient(path) as client:
+            state, _ = client.reset(seed=seed)
+            ref, _ = env.reset(seed=seed)
+            for _ in range(nb_step):
+                for name in ['observation', 'mask', 'completion', 'eligibility']:
+                    assert np.array_equal(state[name], ref[name]), name
+                action = actions[rng.randint(len(actions))]
+                state, reward, done, _ = client.step(action)
+                ref, ref_reward, ref_done, _ = env.step(action)
+                assert reward == ref_reward
+                if done or ref_done:
+                    state, _ = client.reset(seed=seed)
+                    ref, _ = env.reset(seed=seed)
+    except Exception as e:
+        errors.append(e)
+
+
+def test_round_trip(server_path):
+    errors = []
+    _play(server_path, 0, 100, errors)
+    assert errors == []
+
+
+def test_concurrent_clients(server_path):
+    # the steps of both clients are batched in the same VecMazeEnv
+    errors = []
+    threads = [threading.Thread(target=_play, args=(server_path, seed, 100, errors))
+               for seed in [1, 2]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_errors(server_path):
+    with EnvClient(server_path) as client:
+        with pytest.raises(RuntimeError):
+            client.step(KEY.UP)  # not reset
+        client.reset(seed=0)
+        with pytest.raises(RuntimeError):
+            client.step(KEY.QUIT)
+        client.step(KEY.UP)  # the connection is still usable
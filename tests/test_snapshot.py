@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from sge.mazeenv import MazeEnv
+
+
+def _run(env, actions):
+    # states, rewards and done flags of the next steps, then the next random number
+    result = []
+    for action in actions:
+        state, reward, done, _ = env.step(action)
+        result.append((
+            {key: np.array(value, copy=True) for key, value in state.items()},
+            reward, done, env.executed_sub_ind))
+        if done:
+            break
+    return result, env.rng.random()
+
+
+def _check_same(result, expected):
+    steps, u = result
+    expected_steps, expected_u = expected
+    assert len(steps) == len(expected_steps)
+    for (state, reward, done, sub_ind), (e_state, e_reward, e_done, e_sub_ind) in \
+            zip(steps, expected_steps):
+        assert sorted(state) == sorted(e_state)
+        for key in state:
+            assert np.array_equal(state[key], e_state[key]), key
+        assert (reward, done, sub_ind) == (e_reward, e_done, e_sub_ind)
+    assert u == expected_u
+
+
+@pytest.mark.parametrize('game_name, graph_param', [('playground', 'D1_train_1'), ('mining', 'train_1')])
+@pytest.mark.parametrize('elig_engine', ['matrix', 'incremental'])
+def test_restore(game_name, graph_param, elig_engine):
+    # restoring a snapshot, into the same env or into a fresh one, gives
+    # exactly the same continuation
+    env = MazeEnv(game_name, graph_param, 60, 0.99, elig_engine=elig_engine)
+    actions = sorted(env.get_actions(), key=lambda action: action.value[0])
+    rng = random.Random(0)
+    for episode in range(4):
+        env.reset(seed=episode)
+        for _ in range(rng.randrange(20)):
+            env.step(rng.choice(actions))
+        snapshot = env.get_state_snapshot()
+        future = [rng.choice(actions) for _ in range(30)]
+        expected = _run(env, future)
+
+        env.restore_state_snapshot(snapshot)
+        _check_same(_run(env, future), expected)
+
+        fresh = MazeEnv(game_name, graph_param, 60, 0.99, elig_engine=elig_engine)
+        fresh.restore_state_snapshot(snapshot)
+        _check_same(_run(fresh, future), expected)
+
+
+def test_snapshot_before_reset():
+    env = MazeEnv('playground', 'D1_train_1', 60, 0.99)
+    with pytest.raises(RuntimeError):
+        env.get_state_snapshot()
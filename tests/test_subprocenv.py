@@ -0,0 +1,17 @@
+import numpy as np
+from sge.subprocenv import SubprocVecEnv
+
+
+def test_scalar_seed_reset():
+    # a single seed spawns one generator per worker: distinct, reproducible
+    env = SubprocVecEnv('playground', 'D1_train_1', 60, 0.99, nb_env=3)
+    try:
+        state, info = env.reset(seed=3)
+        obs = state['observation'].copy()
+        graph_index = info['graph_index'].copy()
+        assert len(set(obs[n].tobytes() for n in range(3))) == 3
+        state, info = env.reset(seed=3)
+        assert np.array_equal(state['observation'], obs)
+        assert np.array_equal(info['graph_index'], graph_index)
+    finally:
+        env.close()
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+import pytest
+
+from sge.mazeenv import MazeEnv
+from sge.trajectory import TrajectoryRecorder, TrajectoryReader, replay, \
+    get_observations, get_observation
+
+
+@pytest.mark.parametrize('game_name, graph_param, compress', [
+    ('playground', 'D1_train_1', True), ('mining', 'train_1', False)])
+def test_record_replay(tmp_path, game_name, graph_param, compress):
+    # the stored observation deltas and the replay from the seed give back
+    # exactly the recorded episodes
+    fname = str(tmp_path / 'data.sgtraj')
+    env = MazeEnv(game_name, graph_param, 40, 0.99)
+    actions = sorted(env.get_actions(), key=lambda action: action.value[0])
+    rng = random.Random(0)
+    recorded = []
+    with TrajectoryRecorder(env, fname, chunk_size=3, compress=compress,
+                            store_obs=True) as rec:
+        for episode in range(7):
+            graph_index = None if episode % 2 else episode
+            state, _ = rec.reset(seed=episode, graph_index=graph_index)
+            steps = [(state['observation'].copy(), 0.0)]
+            done = False
+            while not done:
+                state, reward, done, _ = rec.step(rng.choice(actions))
+                steps.append((state['observation'].copy(), reward))
+            recorded.append(steps)
+
+    reader = TrajectoryReader(fname)
+    episodes = list(reader)
+    assert len(episodes) == len(recorded)
+    replay_env = reader.make_env()
+    for episode, steps in zip(episodes, recorded):
+        obs = np.array([o for o, _ in steps])
+        assert np.array_equal(get_observations(episode), obs)
+        assert np.array_equal(get_observations(episode, 2, 5), obs[2:5])
+        assert np.array_equal(get_observation(episode, len(steps) - 1), obs[-1])
+        assert np.allclose(episode['rewards'], [r for _, r in steps[1:]])
+        nb_step = 0
+        for (state, reward, done, _), (o, r) in zip(replay(replay_env, episode), steps):
+            assert np.array_equal(state['observation'], o)
+            assert reward == r
+            nb_step += 1
+        assert nb_step == len(steps) and done
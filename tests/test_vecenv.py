@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+import pytest
+
+from sge.mazeenv import MazeEnv
+from sge.vecenv import VecMazeEnv
+
+
+def _check_same(state, reward, done, vstate, vreward, vdone, n):
+    for key in state:
+        assert np.array_equal(np.asarray(state[key]), vstate[key][n]), key
+    assert reward == vreward[n]
+    assert done == vdone[n]
+
+
+@pytest.mark.parametrize('game_name, graph_param', [
+    ('playground', 'D1_train_1'), ('playground', 'D4_eval_1'), ('mining', 'train_1')])
+def test_matches_mazeenv(game_name, graph_param):
+    # same seeds and actions: VecMazeEnv steps exactly like N MazeEnvs
+    N = 4
+    envs = [MazeEnv(game_name, graph_param, 60, 0.99) for _ in range(N)]
+    venv = VecMazeEnv(game_name, graph_param, 60, 0.99, N)
+    for n in range(N):
+        envs[n].game_length = venv.game_length[n]
+    actions = sorted(venv.get_actions(), key=lambda action: action.value[0])
+    rng = random.Random(0)
+    for episode in range(5):
+        seeds = [episode * N + n for n in range(N)]
+        vstate, _ = venv.reset(seed=seeds)
+        for n in range(N):
+            state, _ = envs[n].reset(seed=seeds[n])
+            _check_same(state, 0, False, vstate, [0] * N, [False] * N, n)
+        done = np.zeros(N, dtype=np.bool_)
+        while not done.any():
+            action = [rng.choice(actions) for _ in range(N)]
+            vstate, vreward, done, _ = venv.step(action)
+            for n in range(N):
+                state, reward, d, _ = envs[n].step(action[n])
+                _check_same(state, reward, d, vstate, vreward, done, n)
+
+
+def test_step_subset():
+    # env_ids steps only the given envs, the others are left unchanged
+    N = 3
+    envs = [MazeEnv('playground', 'D1_train_1', 60, 0.99) for _ in range(N)]
+    venv = VecMazeEnv('playground', 'D1_train_1', 60, 0.99, N)
+    actions = sorted(venv.get_actions(), key=lambda action: action.value[0])
+    vstate, _ = venv.reset(seed=[1, 2, 3])
+    for n in range(N):
+        envs[n].game_length = venv.game_length[n]
+        envs[n].reset(seed=n + 1)
+    rng = random.Random(1)
+    for _ in range(30):
+        env_ids = sorted(rng.sample(range(N), rng.randint(1, N)))
+        action = [rng.choice(actions) for _ in env_ids]
+        before = vstate['observation'].copy()
+        vstate, vreward, done, _ = venv.step(action, env_ids=env_ids)
+        if done.any():
+            break
+        for j, n in enumerate(env_ids):
+            state, reward, d, _ = envs[n].step(action[j])
+            _check_same(state, reward, d, vstate, vreward, done, n)
+        for n in set(range(N)) - set(env_ids):
+            assert np.array_equal(vstate['observation'][n], before[n])
+            assert vreward[n] == 0